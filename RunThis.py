@@ -6,17 +6,27 @@ eposterNoMenu.py (Master Display Controller)
 import os
 import sys
 import time
-import json
 import pygame
 from pathlib import Path
 from datetime import datetime
 import socket
+import copy
+import bisect
+import itertools
 
 # --- Custom Modules ---
 import wifi_connect
 import api_handler
 import cache_handler
+import cache_index
 import display_handler
+import render_cache
+import prefetch_handler
+import schedule_index
+import poster_store
+import config_service
+import file_utils
+import thumbnail_loader
 
 # -------------------------
 # Configuration & Constants
@@ -25,6 +35,10 @@ SCRIPT_DIR = Path(__file__).parent
 CONFIG_FILE = SCRIPT_DIR / 'config.json'
 API_DATA_JSON = SCRIPT_DIR / "api_data.json"
 CACHE_DIR = SCRIPT_DIR / "eposter_cache"
+# Posted by the config watcher thread; event.changes lists ConfigChange tuples
+CONFIG_CHANGED = pygame.event.custom_type()
+# Posted by the prefetch worker when a background sync finished; event.device_id
+SYNC_DONE = pygame.event.custom_type()
 
 # -------------------------
 # Utility Functions
@@ -34,91 +48,97 @@ def log(message, level="INFO"):
     print(f"[{timestamp}] [{level}] {message}")
 
 def load_config():
-    try:
-        with open(CONFIG_FILE, 'r') as f: return json.load(f)
-    except: return {}
+    """Returns the in-memory config snapshot kept by config_service."""
+    return config_service.get() or {}
+
+def post_config_changes(changes):
+    """config_service subscriber: wakes the mode loops with a CONFIG_CHANGED event."""
+    pygame.event.post(pygame.event.Event(CONFIG_CHANGED, changes=changes))
 
 def update_config_mode(new_mode):
     try:
-        data = load_config()
+        data = copy.deepcopy(load_config())
         if 'display' not in data: data['display'] = {}
         data['display']['Mode'] = new_mode
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        file_utils.atomic_write_json(CONFIG_FILE, data, indent=2)
         log(f"Config updated: Mode set to {new_mode}", "INFO")
     except Exception as e:
         log(f"Config write error: {e}", "ERROR")
 
-def parse_datetime(date_str, fmt="%d-%m-%Y %H:%M:%S"):
-    try: return datetime.strptime(date_str, fmt)
-    except: return None
+def wait_for_events(deadline):
+    """
+    Blocks until a pygame event arrives or time.time() reaches deadline,
+    then returns every pending event. QUIT and 'q' exit the program.
+    """
+    timeout_ms = int((deadline - time.time()) * 1000)
+    if timeout_ms > 0:
+        first = pygame.event.wait(timeout_ms)
+        events = [first] if first.type != pygame.NOEVENT else []
+    else:
+        events = []
+    events += pygame.event.get()
+    for event in events:
+        if event.type == pygame.QUIT: sys.exit()
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_q: sys.exit()
+    return events
 
 # ---------------------------------------------------------
 # DATA & SYNC HELPER
 # ---------------------------------------------------------
-def get_device_records(device_id):
-    if not API_DATA_JSON.exists():
-        return [], 5
-
-    try:
-        with open(API_DATA_JSON, 'r') as f:
-            data = json.load(f)
-
-        records = []
-        minutes_per_record = 5  # default
-
-        # Try screens first (currently empty in API, but keep for future)
-        screens = data.get("screens", [])
-        my_screen = next((s for s in screens if str(s.get("screen_number")) == str(device_id)), None)
-
-        if my_screen:
-            minutes_per_record = my_screen.get("minutes_per_record", 5)
-            for r in my_screen.get("records", []):
-                s = parse_datetime(r.get("start_date_time"))
-                e = parse_datetime(r.get("end_date_time"))
-                if s and e:
-                    r["start_dt"] = s
-                    r["end_dt"] = e
-                    records.append(r)
-
-        # Always also check booking_slot for this screen
-        bookings = data.get("booking_slot", [])
-        for b in bookings:
-            if str(b.get("screen_number")) != str(device_id):
-                continue
-
-            # booking_slot entries have records as a list directly
-            slot_records = b.get("records", [])
-            if not isinstance(slot_records, list):
-                continue
-
-            for r in slot_records:
-                s = parse_datetime(r.get("start_date_time"))
-                e = parse_datetime(r.get("end_date_time"))
-                if s and e:
-                    r["start_dt"] = s
-                    r["end_dt"] = e
-                    records.append(r)
-
-        return records, minutes_per_record
-
-    except Exception as e:
-        log(f"Error parsing records: {e}", "ERROR")
-        return [], 5
-
+# device_id -> (poster signature, sync time) of the last complete cache sync
+_last_sync = {}
+
+def screensaver_progress(screen, scr_w, scr_h, rotation, title):
+    """Returns a sync_cache progress callback that reports on the screensaver status bar."""
+    def report(done, total):
+        pygame.event.pump()
+        display_handler.show_screensaver_message(screen, scr_w, scr_h, f"{title}\nDownloading posters {done}/{total}", rotation)
+    return report
   
-def refresh_data_and_cache(poster_token, device_id):
+def refresh_data_and_cache(poster_token, device_id, progress=None):
     
     log(f"--- Refreshing Data for Device: {device_id} ---", "INFO")
+    cache_index.flush()
     if wifi_connect.ensure_wifi_connection():
-        new_data = api_handler.fetch_posters(poster_token)
-        if new_data:
-            with open(API_DATA_JSON, 'w') as f: json.dump(new_data, f)
-    records, duration = get_device_records(device_id)
+        # fetch_posters saves api_data.json itself and leaves it untouched when unchanged
+        api_handler.fetch_posters(poster_token)
+    # The only place api_data.json is re-read; everything else uses the store
+    poster_store.refresh()
+    records, duration = poster_store.records(device_id)
+
+    # Skip the sync when this screen's posters are unchanged and all cached
+    # for the current screen geometry, unless it is time to revalidate them
+    signature = tuple((r.get("PosterId") or r.get("id"), r.get("eposter_file") or r.get("file")) for r in records)
+    last = _last_sync.get(str(device_id))
+    if (last and last[0] == signature and last[2] == cache_handler.display_geometry()
+            and time.time() - last[1] < cache_handler.POSTER_REVALIDATE_SECONDS):
+        log("Poster list unchanged for this screen, skipping cache sync", "INFO")
+        return records, duration
     
-    cache_handler.sync_cache((records or []))
+    cache_handler.sync_cache((records or []), progress=progress)
+    expected = {str(pid) for pid, _ in signature if pid}
+    if records and all(cache_handler.get_image_path(pid) for pid in expected):
+        _last_sync[str(device_id)] = (signature, time.time(), cache_handler.display_geometry())
+    else:
+        _last_sync.pop(str(device_id), None)
     return records, duration
 
+def sync_in_background(poster_token, device_id):
+    """
+    Queues refresh_data_and_cache on the prefetch worker, so the render loop
+    never waits on the network. SYNC_DONE wakes the mode loop afterwards.
+    """
+    def job():
+        refresh_data_and_cache(poster_token, device_id)
+        pygame.event.post(pygame.event.Event(SYNC_DONE, device_id=device_id))
+    prefetch_handler.request_sync(job)
+
+def menu_thumbnail_size(screen, rotation):
+    """The (w, h) box MENU mode fits poster thumbnails into."""
+    phy_w, phy_h = screen.get_size()
+    ui_w, ui_h = (phy_h, phy_w) if rotation in [90, 270] else (phy_w, phy_h)
+    return int(ui_w * 0.8), int(ui_h * 0.5)
+
 # ---------------------------------------------------------
 # STARTUP SEQUENCE
 # ---------------------------------------------------------
@@ -128,9 +148,12 @@ def system_startup_check(screen):
     rotation = int(cfg.get('display', {}).get('rotation_degree', 0))
     token = cfg.get('api', {}).get('poster_token')
     dev_id = cfg.get('display', {}).get('device_id')
+    # Thumbnails for MENU mode and frames for this screen are generated as posters are downloaded
+    cache_handler.register_thumbnail_size(menu_thumbnail_size(screen, rotation))
+    cache_handler.register_display_geometry(scr_w, scr_h, rotation)
 
     display_handler.show_screensaver_message(screen, scr_w, scr_h, "System Startup...\nChecking WiFi & Syncing Data", rotation)
-    refresh_data_and_cache(token, dev_id)
+    refresh_data_and_cache(token, dev_id, progress=screensaver_progress(screen, scr_w, scr_h, rotation, "System Startup..."))
     display_handler.show_screensaver_message(screen, scr_w, scr_h, "Startup Complete!\nStarting Mode...", rotation)
     time.sleep(1)
 
@@ -144,51 +167,65 @@ def run_time_mode(screen, clock):
     token = cfg.get('api', {}).get('poster_token')
     rotation = int(cfg.get('display', {}).get('rotation_degree', 0))
     scr_w, scr_h = screen.get_size()
-    records, duration = get_device_records(device_id)
+    records, duration = poster_store.records(device_id)
+    schedule = poster_store.schedule(device_id)
+    cache_handler.register_display_geometry(scr_w, scr_h, rotation)
+    prefetch_handler.update(records, scr_w, scr_h, rotation)
     
     poster_end_time = 0
     next_sync_time = time.time() + 30 
-    last_config_check = time.time()
+    config_changed = synced = False
 
     running = True
     while running:
         current_time = time.time()
     
-        if current_time - last_config_check > 2:
+        if config_changed:
+            config_changed = False
             check_cfg = load_config()
             if check_cfg.get('display', {}).get('Mode') != "Time": return
-            rotation = int(check_cfg.get('display', {}).get('rotation_degree', 0))
+            new_rotation = int(check_cfg.get('display', {}).get('rotation_degree', 0))
+            if new_rotation != rotation:
+                render_cache.invalidate(rotation=rotation)
+                rotation = new_rotation
+                cache_handler.register_display_geometry(scr_w, scr_h, rotation)
+                poster_end_time = 0
+                prefetch_handler.update(records, scr_w, scr_h, rotation)
             new_id = check_cfg.get('display', {}).get('device_id')
             if str(new_id) != str(device_id):
                 display_handler.show_screensaver_message(screen, scr_w, scr_h, "Device ID Changed\nRefetching Data...", rotation)
                 device_id = new_id
-                records, duration = refresh_data_and_cache(token, device_id)
+                records, duration = refresh_data_and_cache(token, device_id, progress=screensaver_progress(screen, scr_w, scr_h, rotation, "Device ID Changed"))
+                schedule = poster_store.schedule(device_id)
+                prefetch_handler.update(records, scr_w, scr_h, rotation)
                 poster_end_time = 0 
-            last_config_check = current_time
 
-        if current_time > next_sync_time:
-            records, duration = refresh_data_and_cache(token, device_id)
+        if current_time >= next_sync_time:
+            sync_in_background(token, device_id)
             next_sync_time = current_time + 30
-            poster_end_time = 0 
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT: sys.exit()
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_q: sys.exit()
+        if synced:
+            # The worker fetched and cached; only the in-memory store is re-read here
+            synced = False
+            poster_store.refresh()
+            records, duration = poster_store.records(device_id)
+            schedule = poster_store.schedule(device_id)
+            prefetch_handler.update(records, scr_w, scr_h, rotation)
+            poster_end_time = 0 
 
         if not records:
-            print("<TIME>Records Empty Showing ScreenSaver")
-            display_handler.show_screensaver_message(screen, scr_w, scr_h, "", rotation)
-            pygame.display.flip()
-            time.sleep(1)
-            continue
+            if current_time >= poster_end_time:
+                print("<TIME>Records Empty Showing ScreenSaver")
+                display_handler.show_screensaver_message(screen, scr_w, scr_h, "", rotation)
+                pygame.display.flip()
+                poster_end_time = current_time + 5
             
-        if current_time >= poster_end_time:
+        elif current_time >= poster_end_time:
             now = datetime.now()
-            active = None
-            for r in sorted(records, key=lambda item: item.get("start_dt") or now):
-                if r["start_dt"] <= now <= r["end_dt"]:
-                    active = r
-                    break
+            active = schedule_index.active_record(schedule, now)
+            # Nothing to redo until the schedule changes (sync resets this)
+            until_change = schedule_index.seconds_until_change(schedule, now)
+            if until_change is None: until_change = 30
             if active:
                 pid = active.get("id") or active.get("PosterId")
                 paper_id = active.get("paper_id")
@@ -196,21 +233,27 @@ def run_time_mode(screen, clock):
                 if path and path.exists():
                     print("<TIME>displaying Image pid : " , pid)
                     display_handler.display_image(screen, path, scr_w, scr_h, rotation)
+                    cache_handler.mark_displayed(pid)
                     display_handler.display_url(screen, scr_w, scr_h, rotation, poster_id=paper_id)
                     pygame.display.flip()
-                    poster_end_time = current_time + max(5, min(duration, (active["end_dt"] - now).total_seconds()))
+                    poster_end_time = current_time + max(1, until_change)
                 else:
                     print("<TIME>NO Schedualted Showing ScreenSaver")
                     display_handler.show_screensaver_message(screen, scr_w, scr_h, f"Downloading ID: {pid}...", rotation)
                     pygame.display.flip()
-                    cache_handler.sync_cache([active]) 
+                    # Download happens on the prefetch worker; re-check shortly
+                    prefetch_handler.update(records, scr_w, scr_h, rotation)
                     poster_end_time = current_time + 2
             else:
                 print("<TIME>Activate False  / Did Not Find Any Image  , Showing ScreenSaver")
                 display_handler.show_screensaver_message(screen, scr_w, scr_h, "", rotation)
                 pygame.display.flip()
-                poster_end_time = current_time + 5
-        clock.tick(30)
+                poster_end_time = current_time + max(1, until_change)
+
+        # Sleep until the next poster change, sync or config change
+        for event in wait_for_events(min(poster_end_time, next_sync_time)):
+            if event.type == CONFIG_CHANGED: config_changed = True
+            if event.type == SYNC_DONE and str(event.device_id) == str(device_id): synced = True
 
 # ---------------------------------------------------------
 # MODE 2: SCROLL
@@ -223,67 +266,73 @@ def run_scroll_mode(screen, clock):
     scroll_delay = int(cfg.get('display', {}).get('Auto_Scroll', 5))
     rotation = int(cfg.get('display', {}).get('rotation_degree', 0))
     scr_w, scr_h = screen.get_size()
+    cache_handler.register_display_geometry(scr_w, scr_h, rotation)
 
     def get_valid_images(recs):
         if recs:
             ids = [str(r.get("id") or r.get("PosterId")) for r in recs]
-            imgs = [p for i in ids if (p := cache_handler.get_image_path(i))]
+            imgs = [(i, p) for i in ids if (p := cache_handler.get_image_path(i))]
             return imgs
-        return sorted([f for f in CACHE_DIR.glob('*') if f.suffix.lower() in ['.png', '.jpg', '.jpeg']])
+        return cache_handler.cached_images()
 
-    records, _ = get_device_records(device_id)
+    records, _ = poster_store.records(device_id)
 
     images = get_valid_images(records)
     index = 0
     next_switch = 0
     next_sync_time = time.time() + 30
-    last_config_check = time.time()
+    config_changed = False
 
     running = True
     while running:
         current_time = time.time()
         
-        if current_time - last_config_check > 2:
+        if config_changed:
+            config_changed = False
             check_cfg = load_config()
             if check_cfg.get('display', {}).get('Mode') != "Scroll": return
-            rotation = int(check_cfg.get('display', {}).get('rotation_degree', 0))
+            new_rotation = int(check_cfg.get('display', {}).get('rotation_degree', 0))
+            if new_rotation != rotation:
+                render_cache.invalidate(rotation=rotation)
+                rotation = new_rotation
+                cache_handler.register_display_geometry(scr_w, scr_h, rotation)
+                next_switch = 0
             scroll_delay = int(check_cfg.get('display', {}).get('Auto_Scroll', 5))
             new_id = check_cfg.get('display', {}).get('device_id')
             if str(new_id) != str(device_id):
                 display_handler.show_screensaver_message(screen, scr_w, scr_h, "Device ID Changed...", rotation)
                 device_id = new_id
-                records, _ = refresh_data_and_cache(token, device_id)
+                records, _ = refresh_data_and_cache(token, device_id, progress=screensaver_progress(screen, scr_w, scr_h, rotation, "Device ID Changed"))
                 images = get_valid_images(records)
                 index = 0
-            last_config_check = current_time
 
-        if current_time > next_sync_time:
+        if current_time >= next_sync_time:
             records, _ = refresh_data_and_cache(token, device_id)
             images = get_valid_images(records)
             next_sync_time = current_time + 30
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT: sys.exit()
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_q: sys.exit()
-
-        if not images:
-            display_handler.show_screensaver_message(screen, scr_w, scr_h, "", rotation)
-            pygame.display.flip()
-            time.sleep(2)
+        if not images and current_time >= next_switch:
             images = get_valid_images(records)
-            continue
+            if not images:
+                display_handler.show_screensaver_message(screen, scr_w, scr_h, "", rotation)
+                pygame.display.flip()
+                next_switch = current_time + 2
 
-        if current_time >= next_switch:
+        if images and current_time >= next_switch:
             if index >= len(images): index = 0
-            if images[index].exists():
-                display_handler.display_image(screen, images[index], scr_w, scr_h, rotation)
-                img_id = images[index].stem
-                paper_id = next((r.get("paper_id") for r in records if str(r.get("id")) == str(img_id)), img_id)
+            img_id, img_path = images[index]
+            if img_path.exists():
+                display_handler.display_image(screen, img_path, scr_w, scr_h, rotation)
+                cache_handler.mark_displayed(img_id)
+                paper_id = poster_store.paper_id(img_id)
                 display_handler.display_url(screen, scr_w, scr_h, rotation, poster_id=paper_id)
                 pygame.display.flip()
             index = (index + 1) % len(images)
             next_switch = current_time + scroll_delay
-        clock.tick(30)
+
+        # Sleep until the next slide, sync or config change
+        for event in wait_for_events(min(next_switch, next_sync_time)):
+            if event.type == CONFIG_CHANGED: config_changed = True
 
 # ---------------------------------------------------------
 # MODE 3: MENU (Rotated Interactive)
@@ -295,19 +344,23 @@ def run_menu_mode(screen, clock):
     token = cfg.get('api', {}).get('poster_token')
     rotation = int(cfg.get('display', {}).get('rotation_degree', 0))
     PHY_W, PHY_H = screen.get_size()
+    cache_handler.register_display_geometry(PHY_W, PHY_H, rotation)
 
     if rotation in [90, 270]: UI_W, UI_H = PHY_H, PHY_W
     else: UI_W, UI_H = PHY_W, PHY_H
 
-    ui_surface = pygame.Surface((UI_W, UI_H))
     BG_COLOR, TOPBAR_COLOR = (18, 18, 18), (28, 28, 28)
     BUTTON_COLOR, BUTTON_HOVER = (50, 90, 160), (70, 120, 200)
     ITEM_BG, HOVER_COLOR, TEXT_COLOR = (35, 35, 35), (60, 60, 60), (230, 230, 230)
     
-    IMAGE_MAX_WIDTH, IMAGE_MAX_HEIGHT = int(UI_W * 0.8), int(UI_H * 0.5)
+    IMAGE_MAX_WIDTH, IMAGE_MAX_HEIGHT = menu_thumbnail_size(screen, rotation)
+    cache_handler.register_thumbnail_size((IMAGE_MAX_WIDTH, IMAGE_MAX_HEIGHT))
     TOPBAR_HEIGHT, BUTTON_WIDTH, BUTTON_HEIGHT = 70, 220, 45
     ITEM_PADDING, TEXT_HEIGHT, SCROLL_SPEED = 25, 30, 50
-    button_font = pygame.font.SysFont("arial", 24, bold=True)
+    ITEM_GAP, PLACEHOLDER_COLOR = 25, (45, 45, 45)
+    KEY_COLOR = (255, 0, 255)  # rounded tile corners, blitted as transparent
+    READ_AHEAD = 3  # items kept decoded beyond each edge of the visible window
+    thumb_box = (IMAGE_MAX_WIDTH, IMAGE_MAX_HEIGHT)
     button_rect = pygame.Rect(30, TOPBAR_HEIGHT//2 - BUTTON_HEIGHT//2, BUTTON_WIDTH, BUTTON_HEIGHT)
 
     def map_mouse(px, py):
@@ -317,98 +370,195 @@ def run_menu_mode(screen, clock):
         if rotation == 270: return PHY_H - py, px
         return px, py
 
-    def load_menu_images():
+    def load_menu_items():
+        # Layout only needs each thumbnail's size; pixels are decoded lazily
         loaded_items = []
-        files = sorted([f for f in CACHE_DIR.glob('*') if f.suffix.lower() in ['.png', '.jpg', '.jpeg']])
-        for path in files:
-            try:
-                img = pygame.image.load(path).convert_alpha()
-                w, h = img.get_size()
-                scale = min(IMAGE_MAX_WIDTH / w, IMAGE_MAX_HEIGHT / h)
-                img = pygame.transform.smoothscale(img, (int(w * scale), int(h * scale)))
-                loaded_items.append({"image": img, "path": path, "height": img.get_height() + TEXT_HEIGHT + ITEM_PADDING * 2})
-            except: pass
+        for pid, path in cache_handler.cached_images():
+            dims = cache_handler.image_dims(pid, path)
+            if not dims: continue
+            thumb_w, thumb_h = cache_handler.fit_size(dims, thumb_box)
+            loaded_items.append({"id": pid, "path": path, "thumb_size": (thumb_w, thumb_h),
+                                 "height": thumb_h + TEXT_HEIGHT + ITEM_PADDING * 2})
         return loaded_items
-    
+
     display_handler.show_screensaver_message(screen, PHY_W, PHY_H, "Loading Menu...", rotation)
-    items = load_menu_images()
-    scroll_y, next_sync_time, last_config_check = 0, time.time() + 30, time.time()
+    items = load_menu_items()
+    # tops[i] is the y of item i within the list; tops[-1] is the list height
+    tops = list(itertools.accumulate((i["height"] + ITEM_GAP for i in items), initial=0))
+    thumbs, window = {}, None  # decoded thumbnails for the current window only
+
+    def visible_range(list_y):
+        first = max(0, bisect.bisect_right(tops, -list_y) - 1)
+        return first, min(len(items), bisect.bisect_left(tops, UI_H - list_y))
+
+    def item_at(x, y, list_y):
+        if not (40 <= x < UI_W - 40): return None
+        idx = bisect.bisect_right(tops, y - list_y) - 1
+        if 0 <= idx < len(items) and y - list_y < tops[idx] + items[idx]["height"]:
+            return idx
+        return None
+
+    def item_rect(idx, list_y):
+        return pygame.Rect(40, list_y + tops[idx], UI_W - 80, items[idx]["height"])
+
+    # The menu is laid out in logical (UI) coordinates but drawn straight onto
+    # the screen: each tile is rotated once when built, never per frame
+    def to_screen(rect):
+        return display_handler.rotate_rect(rect, PHY_W, PHY_H, rotation)
+
+    def make_tile(surface):
+        tile = pygame.transform.rotate(surface, -rotation) if rotation else surface
+        tile.set_colorkey(KEY_COLOR)
+        return tile
+
+    topbar_rect = pygame.Rect(0, 0, UI_W, TOPBAR_HEIGHT)
+    topbar_tiles = {}  # button hovered -> tile
+    def topbar_tile(hovered):
+        if hovered not in topbar_tiles:
+            bar = pygame.Surface(topbar_rect.size).convert()
+            bar.fill(TOPBAR_COLOR)
+            pygame.draw.rect(bar, BUTTON_HOVER if hovered else BUTTON_COLOR, button_rect, border_radius=8)
+            txt = display_handler.render_text("Start Schedule", "arial", 24, True, TEXT_COLOR)
+            bar.blit(txt, (button_rect.centerx - txt.get_width()//2, button_rect.centery - txt.get_height()//2))
+            topbar_tiles[hovered] = make_tile(bar)
+        return topbar_tiles[hovered]
+
+    tiles = {}  # (poster id, hovered, has thumbnail) -> tile, for the current window only
+    def item_tile(item, hovered):
+        img = thumbs.get(item["id"])
+        key = (item["id"], hovered, img is not None)
+        if key not in tiles:
+            tile = pygame.Surface((UI_W - 80, item["height"])).convert()
+            tile.fill(KEY_COLOR)
+            pygame.draw.rect(tile, HOVER_COLOR if hovered else ITEM_BG, tile.get_rect(), border_radius=12)
+            thumb_w, thumb_h = item["thumb_size"]
+            if img:
+                tile.blit(img, (UI_W//2 - img.get_width()//2 - 40, ITEM_PADDING))
+            else:
+                pygame.draw.rect(tile, PLACEHOLDER_COLOR, (UI_W//2 - thumb_w//2 - 40, ITEM_PADDING, thumb_w, thumb_h))
+            tiles[key] = make_tile(tile)
+        return tiles[key]
+
+    def draw_menu(list_y, first, last, clip=None):
+        # With a clip only that region changes; SDL skips blits outside it
+        screen.set_clip(clip)
+        screen.fill(BG_COLOR)
+        display_handler.timed_blit(screen, topbar_tile(button_hover), to_screen(topbar_rect), "menu_topbar")
+        for idx in range(first, last):
+            display_handler.timed_blit(screen, item_tile(items[idx], idx == hover_idx),
+                                       to_screen(item_rect(idx, list_y)), "menu_item")
+        display_handler.display_url(screen, PHY_W, PHY_H, rotation)
+        screen.set_clip(None)
+
+    def request_window(first, last):
+        # Visible items first, then the read-ahead either side
+        lo, hi = max(0, first - READ_AHEAD), min(len(items), last + READ_AHEAD)
+        order = list(range(first, last)) + list(range(last, hi)) + list(range(first - 1, lo - 1, -1))
+        ids = [items[i]["id"] for i in order]
+        keep = set(ids)
+        for pid in [pid for pid in thumbs if pid not in keep]:
+            del thumbs[pid]
+        for key in [key for key in tiles if key[0] not in keep]:
+            del tiles[key]
+        thumbnail_loader.request([pid for pid in ids if pid not in thumbs], thumb_box)
+        return lo, hi, keep
+
+    index_of = {item["id"]: idx for idx, item in enumerate(items)}
+    scroll_y, next_sync_time, config_changed = 0, time.time() + 30, False
+    button_hover, hover_idx = False, None
+    first = last = 0
 
     running = True
+    full_redraw, dirty_rects = True, []  # dirty_rects are logical rects
     while running:
-        clock.tick(60)
-        ui_surface.fill(BG_COLOR)
-        raw_mx, raw_my = pygame.mouse.get_pos()
-        mx, my = map_mouse(raw_mx, raw_my)
         current_time = time.time()
 
-        if current_time - last_config_check > 2:
+        if config_changed:
+            config_changed = False
             check_cfg = load_config()
             if check_cfg.get('display', {}).get('Mode') != "Menu": return
             if str(check_cfg.get('display', {}).get('device_id')) != str(device_id):
                 return # Restart mode
             if int(check_cfg.get('display', {}).get('rotation_degree', 0)) != rotation:
+                render_cache.invalidate(rotation=rotation)
                 return 
-            last_config_check = current_time
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT: sys.exit()
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_q: sys.exit()
+        # Nothing moves on its own: block until input or a config change
+        events = wait_for_events(current_time if full_redraw or dirty_rects else current_time + 60)
+        raw_mx, raw_my = pygame.mouse.get_pos()
+        mx, my = map_mouse(raw_mx, raw_my)
+
+        for event in events:
+            if event.type == CONFIG_CHANGED:
+                config_changed = True
+            if event.type == thumbnail_loader.THUMBNAIL_READY:
+                if window and event.poster_id in window[2] and event.size == thumb_box:
+                    thumbs[event.poster_id] = event.surface.convert() if event.surface else None
+                    idx = index_of[event.poster_id]
+                    if first <= idx < last:
+                        dirty_rects.append(item_rect(idx, scroll_y + TOPBAR_HEIGHT + 20))
+            if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                full_redraw = True
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
                     if button_rect.collidepoint(mx, my):
                         update_config_mode("Time")
                         return
-                    y_offset = scroll_y + TOPBAR_HEIGHT + 20
-                    for item in items:
-                        if y_offset + item['height'] > 0 and y_offset < UI_H:
-                            if pygame.Rect(40, y_offset, UI_W-80, item['height']).collidepoint(mx, my):
-                                display_handler.display_image(screen, item['path'], PHY_W, PHY_H, rotation)
-                                # URL on top of preview
-                                menu_img_id = item['path'].stem
-                                menu_records, _ = get_device_records(device_id)
-                                
-                                menu_paper_id = next((r.get("paper_id") for r in menu_records if str(r.get("id")) == str(menu_img_id)), menu_img_id)
-                                display_handler.display_url(screen, PHY_W, PHY_H, rotation, poster_id=menu_paper_id)
-                                pygame.display.flip()
-                                waiting = True
-                                t_start = time.time()
-                                while waiting:
-                                    for e in pygame.event.get():
-                                        if e.type in [pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN]: waiting = False
-                                    if time.time() - t_start > 60: waiting = False
-                                    clock.tick(30)
-                                break
-                        y_offset += item['height'] + 25
-                elif event.button == 4: scroll_y += SCROLL_SPEED
-                elif event.button == 5: scroll_y -= SCROLL_SPEED
-
-        total_h = sum(i["height"] + 25 for i in items)
+                    idx = item_at(mx, my, scroll_y + TOPBAR_HEIGHT + 20)
+                    if idx is not None:
+                        item = items[idx]
+                        display_handler.display_image(screen, item['path'], PHY_W, PHY_H, rotation)
+                        cache_handler.mark_displayed(item['id'])
+                        # URL on top of preview
+                        menu_paper_id = poster_store.paper_id(item['id'])
+                        display_handler.display_url(screen, PHY_W, PHY_H, rotation, poster_id=menu_paper_id)
+                        pygame.display.flip()
+                        waiting = True
+                        t_start = time.time()
+                        while waiting:
+                            for e in wait_for_events(t_start + 60):
+                                if e.type in [pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN]: waiting = False
+                                # A config change ends the preview and is handled by the menu loop
+                                if e.type == CONFIG_CHANGED: config_changed, waiting = True, False
+                            if time.time() - t_start > 60: waiting = False
+                        # Thumbnails that finished during the preview were dropped with its events
+                        window, full_redraw = None, True
+                elif event.button in (4, 5):
+                    scroll_y += SCROLL_SPEED if event.button == 4 else -SCROLL_SPEED
+                    full_redraw = True
+
+        total_h = tops[-1]
         if total_h > 0:
             scroll_y = max(-max(0, total_h - (UI_H - TOPBAR_HEIGHT)), min(0, scroll_y))
-        
-        pygame.draw.rect(ui_surface, TOPBAR_COLOR, (0, 0, UI_W, TOPBAR_HEIGHT))
-        c = BUTTON_HOVER if button_rect.collidepoint(mx, my) else BUTTON_COLOR
-        pygame.draw.rect(ui_surface, c, button_rect, border_radius=8)
-        txt = button_font.render("Start Schedule", True, TEXT_COLOR)
-        ui_surface.blit(txt, (button_rect.centerx - txt.get_width()//2, button_rect.centery - txt.get_height()//2))
-
-        y = scroll_y + TOPBAR_HEIGHT + 20
-        for item in items:
-            if y + item["height"] > 0 and y < UI_H:
-                rect = pygame.Rect(40, y, UI_W-80, item["height"])
-                bg = HOVER_COLOR if rect.collidepoint(mx, my) else ITEM_BG
-                pygame.draw.rect(ui_surface, bg, rect, border_radius=12)
-                ui_surface.blit(item["image"], (UI_W//2 - item["image"].get_width()//2, y + ITEM_PADDING))
-            y += item["height"] + 25
-
-        if rotation == 0: screen.blit(ui_surface, (0, 0))
-        else:
-            rot_s = pygame.transform.rotate(ui_surface, -rotation)
-            screen.blit(rot_s, ((PHY_W - rot_s.get_width()) // 2, (PHY_H - rot_s.get_height()) // 2))
+        list_y = scroll_y + TOPBAR_HEIGHT + 20
+
+        # Hover only repaints the items (or button) whose highlight changed
+        new_button_hover = button_rect.collidepoint(mx, my)
+        new_hover_idx = item_at(mx, my, list_y)
+        if new_button_hover != button_hover:
+            dirty_rects.append(topbar_rect)
+        if new_hover_idx != hover_idx:
+            dirty_rects += [item_rect(i, list_y) for i in (hover_idx, new_hover_idx) if i is not None]
+        button_hover, hover_idx = new_button_hover, new_hover_idx
+
+        if not (full_redraw or dirty_rects):
+            continue
 
-        display_handler.display_url(screen, PHY_W, PHY_H, rotation)
-        pygame.display.flip()
+        first, last = visible_range(list_y)
+        if window is None or window[:2] != (max(0, first - READ_AHEAD), min(len(items), last + READ_AHEAD)):
+            window = request_window(first, last)
+
+        if full_redraw:
+            draw_menu(list_y, first, last)
+            pygame.display.flip()
+        else:
+            screen_rects = [to_screen(r).clip(screen.get_rect()) for r in dirty_rects]
+            for rect in screen_rects:
+                draw_menu(list_y, first, last, clip=rect)
+            pygame.display.update(screen_rects)
+        full_redraw, dirty_rects = False, []
+        # Caps redraws at 60 fps while the pointer is moving or scrolling
+        clock.tick(60)
 
 # ---------------------------------------------------------
 # MAIN
@@ -419,6 +569,7 @@ def main():
     pygame.mouse.set_visible(True)
     screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     clock = pygame.time.Clock()
+    config_service.subscribe(post_config_changes)
     system_startup_check(screen)
     
     while True:
@@ -429,13 +580,16 @@ def main():
             if event.type == pygame.KEYDOWN and event.key == pygame.K_q: sys.exit()
         if mode == "Time" or mode == "Scroll":
             pygame.mouse.set_visible(False)
-            if mode == "Time": run_time_mode(screen, clock)
+            if mode == "Time":
+                run_time_mode(screen, clock)
+                prefetch_handler.clear()
             elif mode == "Scroll": run_scroll_mode(screen, clock)
             else: update_config_mode("Time")
             
         else:
             pygame.mouse.set_visible(True)
             run_menu_mode(screen, clock)
+            thumbnail_loader.clear()
 
 if __name__ == "__main__":
     main()
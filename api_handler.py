@@ -8,8 +8,11 @@ from pathlib import Path
 import os
 import json
 import requests
+import hashlib
 from datetime import datetime
 
+import file_utils
+
 # Configuration
 with open(Path(__file__).parent / 'config.json', 'r') as f:
     config = json.load(f)
@@ -20,6 +23,7 @@ REQUEST_TIMEOUT = config.get("api", {}).get("request_timeout", 10)
 
 SCRIPT_DIR = Path(__file__).parent
 API_DATA_JSON = SCRIPT_DIR / "api_data.json"
+API_META_JSON = SCRIPT_DIR / "api_data.meta.json"
 
 
 def ensure_api_json():
@@ -32,8 +36,7 @@ def ensure_api_json():
             API_DATA_JSON.parent.mkdir(parents=True, exist_ok=True)
             # Create empty JSON structure
             empty_data = {}
-            with open(API_DATA_JSON, 'w', encoding='utf-8') as f:
-                json.dump(empty_data, f, indent=2, ensure_ascii=False)
+            file_utils.atomic_write_json(API_DATA_JSON, empty_data, indent=2, ensure_ascii=False)
             print(f"[ensure_api_json] Created empty API data file: {API_DATA_JSON}")
         else :
             print(f"[ensure_api_json] API data file already exists: {API_DATA_JSON}")
@@ -56,23 +59,78 @@ def get_current_datetime():
     }
 
 
+def load_api_meta(api, token):
+    """
+    Loads the ETag / Last-Modified stored for the last saved poster list.
+    Only returned if they belong to the same endpoint and token and
+    api_data.json is still on disk.
+    """
+    try:
+        if not API_DATA_JSON.exists():
+            return {}
+        with open(API_META_JSON, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("api") != api or meta.get("token") != token:
+            return {}
+        return meta
+    except Exception:
+        return {}
+
+
+def save_api_meta(api, token, response, content_hash=None):
+    """Stores the validators and payload hash of a poster list response."""
+    meta = {
+        "api": api,
+        "token": token,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_hash": content_hash,
+    }
+    try:
+        file_utils.atomic_write_json(API_META_JSON, meta)
+    except Exception as e:
+        print(f"[fetch_posters] Failed to save API validators: {e}")
+
+
 def fetch_posters(token , api = API_BASE , timeout = REQUEST_TIMEOUT):
     """
     Fetches poster data from API and saves it to api_data.json.
     Handles the new API response structure with status, message, and data array.
+    The request is conditional (If-None-Match / If-Modified-Since); on a 304,
+    or when the payload hash matches the saved one, api_data.json is left
+    untouched so readers can tell nothing changed from its mtime.
     
     Args:
         token: API authentication token
     
     Returns:
-        list: List of poster dicts or None on failure
+        list: The response when the API returns a bare list, else an empty
+        list (also when the poster list is unchanged); read the posters from
+        api_data.json through poster_store. None on failure
     """
     try:
-        r = requests.get(api, params={"key": token}, timeout=timeout)
+        meta = load_api_meta(api, token)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        r = requests.get(api, params={"key": token}, timeout=timeout, headers=headers)
+        if r.status_code == 304:
+            print("[fetch_posters] Poster list not modified")
+            return []
         if r.status_code != 200:
             print(f"[fetch_posters] API returned status {r.status_code}")
             return None
         
+        content_hash = hashlib.sha256(r.content).hexdigest()
+        if meta.get("content_hash") == content_hash:
+            print("[fetch_posters] Poster list unchanged")
+            if (r.headers.get("ETag"), r.headers.get("Last-Modified")) != (meta.get("etag"), meta.get("last_modified")):
+                save_api_meta(api, token, r, content_hash)
+            return []
+
         data = r.json()
         print( f"[fetch_posters] Successfully fetched posters from API")
         # Get current system date/time
@@ -87,8 +145,8 @@ def fetch_posters(token , api = API_BASE , timeout = REQUEST_TIMEOUT):
         # Save the raw API response to JSON file
         try:
             ensure_api_json()  # Ensure file exists
-            with open(API_DATA_JSON, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            file_utils.atomic_write_json(API_DATA_JSON, data, indent=2, ensure_ascii=False)
+            save_api_meta(api, token, r, content_hash)
             print(f"[fetch_posters] Saved API response to {API_DATA_JSON}")
         except Exception as e:
             print(f"[fetch_posters] Failed to save API data to JSON: {e}")
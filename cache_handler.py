@@ -8,6 +8,17 @@ import requests
 import json
 from PIL import Image
 import shutil
+import threading
+import time
+import hashlib
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+import cache_index
+import file_utils
+import render_cache
 
 # Configuration
 try:
@@ -18,28 +29,971 @@ except Exception as e:
     config = {}
 
 REQUEST_TIMEOUT = config.get("api", {}).get("request_timeout", 20)
+DOWNLOAD_CONCURRENCY = max(1, int(config.get("api", {}).get("download_concurrency", 4)))
+DOWNLOAD_PER_HOST = max(1, int(config.get("api", {}).get("download_per_host", 4)))
+POSTER_REVALIDATE_SECONDS = int(config.get("api", {}).get("poster_revalidate_seconds", 600))
+CACHE_BUDGET = int(config.get("api", {}).get("cache_budget_mb", 1024)) * 1024 * 1024
+CACHE_MIN_FREE = int(config.get("api", {}).get("cache_min_free_mb", 200)) * 1024 * 1024
+CACHE_GRACE_SECONDS = float(config.get("api", {}).get("cache_grace_hours", 24)) * 3600
+KEEP_ORIGINALS = bool(config.get("api", {}).get("keep_originals", False))
 SCRIPT_DIR = Path(__file__).parent
 CACHE_DIR = SCRIPT_DIR / "eposter_cache"    
+BLOB_DIR = CACHE_DIR / "blobs"    # content-addressed posters: <sha256>.<ext>
+THUMB_DIR = CACHE_DIR / "thumbs"
+# Display-ready frames (<sha256>_<w>x<h>_r<rotation>.jpg) and, once the
+# original is dropped, an upright copy to re-derive them from (<sha256>_upright.jpg)
+DERIVED_DIR = CACHE_DIR / "derived"
+DERIVED_QUALITY = 95
+UPRIGHT_QUALITY = 95
+PARTIAL_DIR = CACHE_DIR / "partial"  # resumable downloads: <url key>.part + .json
+THUMB_QUALITY = 90
+
+# Target sizes thumbnails are generated for at ingest (registered by MENU mode)
+_thumbnail_sizes = set()
+# (w, h, rotation) of the screen derivatives are rendered for (registered by RunThis)
+_display_geometry = None
+
+_layout_checked = False
+
+# One lock per content hash: storing, deriving and releasing the same
+# content from parallel downloads must not interleave
+_digest_locks = {}
+_digest_locks_lock = threading.Lock()
+
+def _digest_lock(digest):
+    """Returns the lock serialising changes to the files of content with this hash."""
+    with _digest_locks_lock:
+        return _digest_locks.setdefault(digest, threading.RLock())
 
 def ensure_cache():
-    """Creates cache directory if it doesn't exist."""
+    """Creates cache directory if it doesn't exist and upgrades old layouts once."""
+    global _layout_checked
     if not CACHE_DIR.exists():
         print(f"[cache] Creating directory: {CACHE_DIR}")
         CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    if not _layout_checked:
+        _layout_checked = True
+        with _sync_lock:
+            _migrate_legacy_files()
+
+def _stored_name(entry):
+    """Manifest path of any file a poster is cached as, rotation-independent ones first."""
+    return entry.get("path") or entry.get("upright") or entry.get("derived")
+
+def _display_name(entry):
+    """
+    Manifest path to display a poster from on the registered screen: the
+    original, the derivative made for this screen, else the upright copy.
+    """
+    derived = entry.get("derived")
+    if derived and _display_geometry not in (None, derivative_geometry(derived)):
+        derived = None
+    return entry.get("path") or derived or entry.get("upright")
 
 def get_image_path(poster_id):
-    """Finds image for ID regardless of extension."""
-    ensure_cache()
-    # Check for specific extensions to avoid directory confusion
-    for ext in ["png", "jpg", "jpeg", "bmp", "gif"]:
-        path = CACHE_DIR / f"{poster_id}.{ext}"
-        if path.exists() and path.is_file():
-            return path
+    """Returns the cached image for an ID from the manifest (no filesystem access)."""
+    name = _display_name(cache_index.get(poster_id) or {})
+    return CACHE_DIR / name if name else None
+
+def cached_images():
+    """(poster_id, path) for every cached poster, sorted by id."""
+    images = []
+    for pid in sorted(cache_index.ids()):
+        path = get_image_path(pid)
+        if path:
+            images.append((pid, path))
+    return images
+
+def mark_displayed(poster_id):
+    """Records that a poster was shown (persisted by cache_index.flush)."""
+    cache_index.touch(poster_id)
+
+def _cached_file(poster_id):
+    """
+    Manifest path for poster_id, checked on disk. Files that have gone
+    missing are forgotten so the poster is downloaded again. A derivative
+    for another screen only counts while an upright source is left.
+    """
+    entry = cache_index.get(poster_id) or {}
+    for field, cleared in (("path", ("format", "size")), ("upright", ("upright_size",)),
+                           ("derived", ("derived_size",))):
+        if entry.get(field) and not (CACHE_DIR / entry[field]).is_file():
+            print(f"[cache] ID {poster_id}: {entry[field]} is missing on disk, forgetting it")
+            cache_index.update(poster_id, **{name: None for name in (field,) + cleared})
+            del entry[field]
+    name = _display_name(entry)
+    return CACHE_DIR / name if name else None
+
+def blob_name(digest, ext):
+    """Manifest path of the blob holding content with this hash."""
+    return f"{BLOB_DIR.name}/{digest}.{ext}"
+
+def _store_blob(tmp_path, digest, ext):
+    """Moves a downloaded file into the blob store; identical content is stored once."""
+    name = blob_name(digest, ext)
+    target = CACHE_DIR / name
+    if target.is_file():
+        os.remove(tmp_path)
+    else:
+        BLOB_DIR.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+    return name
+
+def _release_blob(digest):
+    """
+    Deletes the blob, derivatives, thumbnails and renders of the content
+    with this hash once no poster links to it.
+    """
+    if not digest:
+        return
+    with _digest_lock(digest):
+        if cache_index.find(sha256=digest):
+            return
+        for path in [*BLOB_DIR.glob(f"{digest}.*"), *DERIVED_DIR.glob(f"{digest}_*")]:
+            try: os.remove(path)
+            except FileNotFoundError: pass
+        remove_thumbnails(digest)
+    render_cache.invalidate(source=digest)
+
+def _entry_for_url(url, exclude=None):
+    """A cached entry downloaded from url whose file is on disk, or None."""
+    for pid in cache_index.find(url=url):
+        entry = cache_index.get(pid)
+        if pid != exclude and _stored_name(entry) and (CACHE_DIR / _stored_name(entry)).is_file():
+            return entry
+    return None
+
+# Manifest fields describing the cached files of a content hash
+FILE_FIELDS = ("path", "format", "size", "sha256", "width", "height", "derived", "derived_size",
+               "upright", "upright_size")
+
+def _link(poster_id, entry, url):
+    """Points poster_id at the blob and derivative of an already cached entry."""
+    shared = FILE_FIELDS + ("etag", "last_modified", "checked_at")
+    old = cache_index.get(poster_id) or {}
+    cache_index.update(poster_id, url=url, **{key: entry.get(key) for key in shared})
+    if old.get("sha256") and old["sha256"] != entry.get("sha256"):
+        _release_blob(old["sha256"])
+
+def _migrate_legacy_files():
+    """
+    Moves <id>.<ext> files from older versions into the blob store and
+    deletes blobs that no manifest entry links to. Blobs are kept when the
+    manifest was just rebuilt: re-downloaded posters reuse them by hash,
+    and the next start sweeps the rest.
+    """
+    for pid in cache_index.ids():
+        entry = cache_index.get(pid) or {}
+        name = entry.get("path")
+        if not name or "/" in name:
+            continue
+        src = CACHE_DIR / name
+        try:
+            digest = entry.get("sha256") or file_hash(src)
+            ext = entry.get("format") or src.suffix.lstrip(".").lower()
+            # Recorded now: the original may be dropped once its derivative exists
+            with Image.open(src) as img:
+                width, height = img.size
+            new_name = blob_name(digest, ext)
+            if (CACHE_DIR / new_name).is_file():
+                os.remove(src)
+            else:
+                BLOB_DIR.mkdir(parents=True, exist_ok=True)
+                os.replace(src, CACHE_DIR / new_name)
+            cache_index.update(pid, path=new_name, sha256=digest, format=ext, width=width, height=height)
+            # Frames rendered from the old file were keyed by the poster id
+            render_cache.invalidate(source=pid)
+        except FileNotFoundError:
+            cache_index.update(pid, path=None, format=None, size=None)
+        except Exception as e:
+            print(f"[cache] ID {pid}: Could not move {name} into the blob store: {e}")
+
+    # Older versions streamed into <id>_temp and never resumed them
+    for tmp in CACHE_DIR.glob("*_temp"):
+        try: os.remove(tmp)
+        except OSError: pass
+
+    if cache_index.rebuilt():
+        if BLOB_DIR.exists() or DERIVED_DIR.exists():
+            print("[cache] Manifest was rebuilt, keeping blobs until it links them again")
+        return
+    linked = {(cache_index.get(pid) or {}).get("sha256") for pid in cache_index.ids()}
+    for folder in (BLOB_DIR, DERIVED_DIR):
+        if not folder.exists():
+            continue
+        for blob in folder.iterdir():
+            digest = blob.name.split(".")[0].split("_")[0]
+            if digest not in linked:
+                print(f"[cache] Removing unreferenced {folder.name}/{blob.name}")
+                _release_blob(digest)
+
+def _sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest
+
+def file_hash(path):
+    """SHA-256 hex digest of a file."""
+    return _sha256_of(path).hexdigest()
+
+def source_hash(poster_id, path=None):
+    """
+    Returns the SHA-256 of a cached poster, from the index when known.
+    Posters cached before hashes were recorded are hashed once.
+    """
+    entry = cache_index.get(poster_id) or {}
+    if entry.get("sha256"):
+        return entry["sha256"]
+    path = path or get_image_path(poster_id)
+    if not path:
+        return None
+    digest = file_hash(path)
+    cache_index.update(poster_id, sha256=digest)
+    return digest
+
+def register_thumbnail_size(size):
+    """Adds a (w, h) box that new downloads get a thumbnail for."""
+    _thumbnail_sizes.add((int(size[0]), int(size[1])))
+
+def fit_size(dims, size):
+    """Scales dims (w, h) to fit the box size (w, h), keeping aspect ratio."""
+    (w, h), (max_w, max_h) = dims, size
+    scale = min(max_w / w, max_h / h)
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+def open_image(path, size):
+    """
+    Opens an image decoded at the cheapest scale that still covers the box
+    size (w, h) once fitted: JPEGs decode at 1/2, 1/4 or 1/8 scale via
+    draft(), other formats are shrunk by a whole factor with reduce()
+    before the full-size pixels are converted.
+    The caller does the final resample. Returns a loaded image.
+    """
+    img = Image.open(path)
+    fw, fh = fit_size(img.size, size)
+    factor = min(img.width // fw, img.height // fh)
+    if factor < 2:
+        img.load()
+        return img
+    if img.format == "JPEG":
+        img.draft(img.mode, (fw, fh))
+        img.load()
+        return img
+    # reduce() is a box filter: stop at twice the target so the final
+    # resample still sees the detail (PIL's own reducing_gap)
+    factor = max(1, factor // 2)
+    with img:
+        try:
+            return img.reduce(factor)
+        except ValueError:
+            # reduce() does not take palette and some bit-depth modes
+            return img.convert("RGBA").reduce(factor)
+
+def image_dims(poster_id, path=None):
+    """
+    Returns the (w, h) of a cached poster from the index, falling back to
+    the image header (no pixels are decoded). None if it is not cached.
+    """
+    entry = cache_index.get(poster_id) or {}
+    if entry.get("width") and entry.get("height"):
+        return entry["width"], entry["height"]
+    # A derivative's header gives the screen size, not the poster's
+    name = entry.get("path") or entry.get("upright")
+    path = CACHE_DIR / name if name else path
+    if not path or derivative_geometry(path):
+        return None
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception as e:
+        print(f"[cache] ID {poster_id}: Could not read image size: {e}")
+        return None
+
+def thumbnail_path(digest, size):
+    return THUMB_DIR / f"{digest}_{int(size[0])}x{int(size[1])}.jpg"
+
+def make_thumbnail(source_path, digest, size, dims=None):
+    """
+    Writes the thumbnail of source_path scaled to fit size (w, h), flattened
+    onto black as JPEG, unless it already exists. Returns its path. For a
+    derivative, dims (the poster's w, h) locate the poster inside the frame.
+    """
+    target = thumbnail_path(digest, size)
+    if target.exists():
+        return target
+    geometry = derivative_geometry(source_path)
+    if geometry:
+        # Derivatives are turned for the screen and letterboxed: turn the
+        # frame upright and keep only the poster
+        with Image.open(source_path) as frame:
+            img = frame.convert("RGB").rotate(geometry[2], expand=True)
+        if dims:
+            w, h = fit_size(dims, img.size)
+            x, y = (img.width - w) // 2, (img.height - h) // 2
+            img = img.crop((x, y, x + w, y + h))
+        else:
+            img = img.crop(img.getbbox() or (0, 0) + img.size)
+        img = img.convert("RGBA")
+    else:
+        with open_image(source_path, size) as img:
+            img = img.convert("RGBA")
+    img = img.resize(fit_size(img.size, size), Image.LANCZOS)
+    flat = Image.new("RGB", img.size, (0, 0, 0))
+    flat.paste(img, (0, 0), img)
+    THUMB_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_suffix(f".{threading.get_ident()}.tmp")
+    flat.save(tmp_path, "JPEG", quality=THUMB_QUALITY)
+    os.replace(tmp_path, target)
+    return target
+
+def get_thumbnail(poster_id, size):
+    """Returns the thumbnail path for a cached poster, generating it if missing."""
+    name = _stored_name(cache_index.get(poster_id) or {})
+    if not name:
+        return None
+    path = CACHE_DIR / name
+    try:
+        return make_thumbnail(path, source_hash(poster_id, path), size, image_dims(poster_id))
+    except Exception as e:
+        print(f"[cache] ID {poster_id}: Thumbnail failed: {e}")
+        return None
+
+def remove_thumbnails(digest):
+    """Deletes every thumbnail generated from the source with this hash."""
+    if not digest or not THUMB_DIR.exists():
+        return
+    for thumb in THUMB_DIR.glob(f"{digest}_*"):
+        try: os.remove(thumb)
+        except OSError: pass
+
+def register_display_geometry(scr_w, scr_h, rotation=0):
+    """Sets the screen size and rotation that posters get a derivative for."""
+    global _display_geometry
+    _display_geometry = (int(scr_w), int(scr_h), int(rotation))
+
+def display_geometry():
+    """The registered (w, h, rotation), or None."""
+    return _display_geometry
+
+def upright_name(digest):
+    """Manifest path of the upright copy kept in place of a dropped original."""
+    return f"{DERIVED_DIR.name}/{digest}_upright.jpg"
+
+def _digest_of(path):
+    """Content hash a blob, derivative or upright copy is named by, else None."""
+    path = Path(path)
+    if path.parent.name not in (BLOB_DIR.name, DERIVED_DIR.name):
+        return None
+    return path.stem.split("_")[0]
+
+def derivative_name(digest, geometry):
+    """Manifest path of the derivative of this content for geometry (w, h, rotation)."""
+    w, h, rotation = geometry
+    return f"{DERIVED_DIR.name}/{digest}_{w}x{h}_r{rotation}.jpg"
+
+def derivative_geometry(path):
+    """The (w, h, rotation) a derivative was rendered for, or None for other files."""
+    path = Path(path)
+    if path.parent.name != DERIVED_DIR.name:
+        return None
+    try:
+        _, size, rotation = path.stem.rsplit("_", 2)
+        w, h = size.split("x")
+        return int(w), int(h), int(rotation.lstrip("r"))
+    except ValueError:
+        return None
+
+def derivative_for(image_path, scr_w, scr_h, rotation=0):
+    """
+    Returns the derivative of a cached poster file matching the screen
+    geometry if it is on disk (image_path itself if it is one), else None.
+    """
+    image_path = Path(image_path)
+    geometry = (int(scr_w), int(scr_h), int(rotation))
+    if derivative_geometry(image_path) == geometry:
+        return image_path
+    digest = _digest_of(image_path)
+    if not digest:
+        return None
+    path = CACHE_DIR / derivative_name(digest, geometry)
+    return path if path.is_file() else None
+
+def upright_source(image_path):
+    """
+    Returns a rotation-independent file for a cached poster file: the file
+    itself unless it is a derivative, else the original or upright copy of
+    its content. None if only derivatives are left.
+    """
+    if not derivative_geometry(image_path):
+        return Path(image_path)
+    digest = _digest_of(image_path)
+    for pid in cache_index.find(sha256=digest):
+        entry = cache_index.get(pid) or {}
+        name = entry.get("path") or entry.get("upright")
+        if name:
+            return CACHE_DIR / name
     return None
 
-def sync_cache(records, timeout=REQUEST_TIMEOUT):
+def make_derivative(source_path, digest, geometry):
+    """
+    Writes the display-ready frame of source_path for geometry (w, h,
+    rotation): rotated, fitted and flattened onto black, as a JPEG without
+    chroma subsampling so text stays sharp. Showing it is a plain decode at
+    panel resolution, a tenth of the size of a raw bitmap on the SD card.
+    Derivatives for other geometries are deleted. Returns its manifest path.
+    """
+    import display_handler  # imported here: display_handler looks derivatives up in this module
+    name = derivative_name(digest, geometry)
+    target = CACHE_DIR / name
+    if not target.is_file():
+        w, h, rotation = geometry
+        with display_handler.open_for_screen(source_path, w, h, rotation) as img:
+            frame = display_handler.compose_frame(img, w, h, rotation)
+        DERIVED_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_suffix(f".{threading.get_ident()}.tmp")
+        frame.save(tmp_path, "JPEG", quality=DERIVED_QUALITY, subsampling=0)
+        os.replace(tmp_path, target)
+    for old in DERIVED_DIR.glob(f"{digest}_*"):
+        if old != target and derivative_geometry(old):
+            try: os.remove(old)
+            except FileNotFoundError: pass
+    return name
+
+def make_upright(source_path, digest, side):
+    """
+    Writes the upright copy of source_path, scaled to fit a side x side box
+    (never enlarged) and flattened onto black as JPEG. It covers the screen
+    at every rotation, so derivatives can be re-made from it without the
+    original. Returns its manifest path.
+    """
+    name = upright_name(digest)
+    target = CACHE_DIR / name
+    if not target.is_file():
+        with open_image(source_path, (side, side)) as img:
+            img = img.convert("RGBA")
+            w, h = fit_size(img.size, (side, side))
+            if w < img.width:
+                img = img.resize((w, h), Image.LANCZOS)
+        flat = Image.new("RGB", img.size, (0, 0, 0))
+        flat.paste(img, (0, 0), img)
+        DERIVED_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_suffix(f".{threading.get_ident()}.tmp")
+        flat.save(tmp_path, "JPEG", quality=UPRIGHT_QUALITY)
+        os.replace(tmp_path, target)
+    return name
+
+def _needs_derivative(entry):
+    """True when a poster has an upright source but no derivative for the current screen."""
+    return bool(_display_geometry and entry.get("sha256") and (entry.get("path") or entry.get("upright"))
+                and entry.get("derived") != derivative_name(entry["sha256"], _display_geometry))
+
+def _derive(poster_id):
+    """
+    Renders the derivative of a cached poster for the registered display
+    geometry, from the original or else its upright copy, and records it
+    for every id sharing the content. Unless KEEP_ORIGINALS, the original
+    is then replaced by an upright copy. Returns the path to display.
+    """
+    entry = cache_index.get(poster_id) or {}
+    if not entry.get("sha256"):
+        return get_image_path(poster_id)
+    with _digest_lock(entry["sha256"]):
+        return _derive_locked(poster_id)
+
+def _derive_locked(poster_id):
+    # Re-read: another id with the same content may have derived it meanwhile
+    entry = cache_index.get(poster_id) or {}
+    geometry = _display_geometry
+    if not _needs_derivative(entry):
+        return get_image_path(poster_id)
+    digest = entry["sha256"]
+    original = CACHE_DIR / entry["path"] if entry.get("path") else None
+    drop = original is not None and not KEEP_ORIGINALS
+    try:
+        fields = {}
+        if original and not (entry.get("width") and entry.get("height")):
+            with Image.open(original) as img:
+                fields["width"], fields["height"] = img.size
+        name = make_derivative(original or CACHE_DIR / entry["upright"], digest, geometry)
+        fields.update(derived=name, derived_size=(CACHE_DIR / name).stat().st_size)
+        if drop:
+            upright = make_upright(original, digest, max(geometry[:2]))
+            fields.update(upright=upright, upright_size=(CACHE_DIR / upright).stat().st_size)
+    except Exception as e:
+        print(f"[cache] ID {poster_id}: Derivative for {geometry} failed, keeping the source: {e}")
+        return get_image_path(poster_id)
+    # Every id sharing the content shares its files
+    if drop:
+        fields.update(path=None, size=None)
+    elif original:
+        fields.update(path=entry["path"], size=entry.get("size"))
+    for pid in cache_index.find(sha256=digest):
+        cache_index.update(pid, **fields)
+    if drop:
+        try: os.remove(original)
+        except FileNotFoundError: pass
+    print(f"[cache] ID {poster_id}: Derivative saved as {name}")
+    return CACHE_DIR / name
+
+def _ingest(poster_id, path, digest):
+    """
+    Runs once per new download: pre-generates thumbnails, then the
+    derivative for the screen. Returns the path to display from.
+    """
+    for size in list(_thumbnail_sizes):
+        try:
+            make_thumbnail(path, digest, size)
+        except Exception as e:
+            print(f"[cache] ID {poster_id}: Thumbnail {size} failed: {e}")
+    return _derive(poster_id)
+
+# Serialises cleanup and download planning between the main loop and the
+# prefetch worker; transfers run outside it so the other thread is not held up
+_sync_lock = threading.RLock()
+
+# One lock per URL: concurrent fetches of a URL would share its partial file
+_download_locks = {}
+_download_locks_lock = threading.Lock()
+
+def _download_lock(url):
+    """Returns the lock serialising downloads of url."""
+    with _download_locks_lock:
+        return _download_locks.setdefault(url, threading.Lock())
+
+# Shared keep-alive session; the pool is sized for the download workers
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=DOWNLOAD_CONCURRENCY, pool_maxsize=DOWNLOAD_CONCURRENCY)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+def _host_slot(url):
+    """Returns the semaphore limiting concurrent downloads from url's host."""
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(DOWNLOAD_PER_HOST)
+        return _host_slots[host]
+
+def _revalidation_due(poster_id, url):
+    """
+    Decides whether an already cached poster should be re-requested.
+    Returns (due, conditional_headers).
+    """
+    entry = cache_index.get(poster_id)
+    if not entry or "url" not in entry:
+        # Cached before validators were tracked; adopt the file as-is
+        cache_index.update(poster_id, url=url, checked_at=time.time())
+        return False, {}
+    if url and entry.get("url") != url:
+        return True, {}
+    headers = cache_index.conditional_headers(entry)
+    # Without validators a refresh would be a full download every time
+    if not headers or not url:
+        return False, {}
+    if time.time() - entry.get("checked_at", 0) < POSTER_REVALIDATE_SECONDS:
+        return False, {}
+    return True, headers
+
+def _needs_download(poster):
+    poster_id = poster.get("PosterId") or poster.get("id")
+    if not poster_id:
+        return False
+    if not _cached_file(poster_id):
+        return True
+    url = poster.get("eposter_file") or poster.get("file")
+    return _revalidation_due(str(poster_id), url)[0]
+
+def _partial_paths(url):
+    """Data and metadata files of the partial download of url."""
+    key = hashlib.sha256(url.encode()).hexdigest()[:32]
+    return PARTIAL_DIR / f"{key}.part", PARTIAL_DIR / f"{key}.json"
+
+def _load_partial(url):
+    """
+    Returns (bytes already downloaded, metadata) for a resumable partial of
+    url. Partials without an ETag or Last-Modified cannot be resumed safely.
+    """
+    data_path, meta_path = _partial_paths(url)
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        size = data_path.stat().st_size
+    except (OSError, ValueError):
+        return 0, {}
+    if meta.get("url") != url or not (meta.get("etag") or meta.get("last_modified")):
+        return 0, {}
+    return size, meta
+
+def _discard_partial(url):
+    for path in _partial_paths(url):
+        try: os.remove(path)
+        except FileNotFoundError: pass
+
+def _keep_partial(poster_id, url):
+    """After a failed transfer: keeps a resumable partial, deletes anything else."""
+    offset, _ = _load_partial(url)
+    if offset:
+        print(f"[cache] ID {poster_id}: Keeping {offset} bytes to resume on the next sync")
+    else:
+        _discard_partial(url)
+
+def _content_range(response):
+    """Returns (start, total) from a Content-Range header; total may be None."""
+    try:
+        unit, spec = response.headers.get("Content-Range", "").split(" ", 1)
+        span, total = spec.split("/")
+        return int(span.split("-")[0]), (None if total == "*" else int(total))
+    except ValueError:
+        return None, None
+
+def _fetch(poster_id, url, headers, timeout):
+    """
+    Streams url into its partial file, continuing an earlier partial with
+    Range / If-Range. Returns (status, data_path, sha256 object, validators)
+    where status is "done", "not_modified", "restart" (the partial was
+    rejected and deleted) or "failed". Network errors propagate with the
+    partial left on disk.
+    """
+    data_path, meta_path = _partial_paths(url)
+    offset, meta = _load_partial(url)
+    # Offsets must count bytes on the wire, so ask for no content-encoding
+    request_headers = dict(headers, **{"Accept-Encoding": "identity"})
+    if offset:
+        request_headers["Range"] = f"bytes={offset}-"
+        request_headers["If-Range"] = meta.get("etag") or meta["last_modified"]
+        print(f"[cache] ID {poster_id}: Resuming from byte {offset}")
+
+    with _host_slot(url):
+        with _session.get(url, stream=True, timeout=timeout, headers=request_headers) as r:
+            if r.status_code == 304:
+                return "not_modified", None, None, {}
+            if r.status_code == 416 and offset:
+                print(f"[cache] ID {poster_id}: Server rejected the resume range, starting over")
+                _discard_partial(url)
+                return "restart", None, None, {}
+
+            validators = cache_index.validators(r)
+            if r.status_code == 206 and offset:
+                start, total = _content_range(r)
+                if start != offset:
+                    print(f"[cache] ID {poster_id}: Unexpected Content-Range, starting over")
+                    _discard_partial(url)
+                    return "restart", None, None, {}
+                validators = {k: v or meta.get(k) for k, v in validators.items()}
+                digest = _sha256_of(data_path)
+                mode = "ab"
+            elif r.status_code == 200:
+                # Server ignored the range or the file changed: full fetch
+                offset, mode, digest = 0, "wb", hashlib.sha256()
+                length = r.headers.get("Content-Length")
+                total = int(length) if length and length.isdigit() else None
+                PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+                if validators.get("etag") or validators.get("last_modified"):
+                    file_utils.atomic_write_json(meta_path, dict(validators, url=url))
+                else:
+                    try: os.remove(meta_path)
+                    except FileNotFoundError: pass
+            else:
+                print(f"[cache] ID {poster_id}: Download Failed (Status code {r.status_code})")
+                return "failed", None, None, {}
+
+            with open(data_path, mode) as fh:
+                for chunk in r.iter_content(65536):
+                    if chunk:
+                        fh.write(chunk)
+                        digest.update(chunk)
+
+    size = data_path.stat().st_size
+    if total is not None and size != total:
+        raise IOError(f"Incomplete download ({size} of {total} bytes)")
+    return "done", data_path, digest, validators
+
+def download_poster(poster, timeout=REQUEST_TIMEOUT):
+    """
+    Downloads a single poster record into the cache unless it is already there.
+    Cached posters are revalidated with If-None-Match / If-Modified-Since
+    once POSTER_REVALIDATE_SECONDS have passed or when their URL changed.
+    An interrupted download is kept in PARTIAL_DIR and resumed by the next
+    call. A URL another thread is downloading is waited for, then shared.
+    Returns the cached path or None.
+    """
+    url = poster.get("eposter_file") or poster.get("file")
+    if not url:
+        return _download_poster(poster, timeout)
+    with _download_lock(url):
+        return _download_poster(poster, timeout)
+
+def _download_poster(poster, timeout):
+    # Get ID
+    poster_id = poster.get("PosterId") or poster.get("id")
+    if not poster_id:
+        print("[cache] Skipping record with missing ID")
+        return None
+        
+    poster_id_str = str(poster_id)
+
+    # Get URL
+    url = poster.get("eposter_file") or poster.get("file")
+    
+    # Check if exists
+    headers = {}
+    existing_file = _cached_file(poster_id_str)
+    if existing_file:
+        due, headers = _revalidation_due(poster_id_str, url)
+        if not due:
+            print(f"[cache] ID {poster_id}: Found existing file ({existing_file.name}). Skipping download.")
+            return existing_file
+
+    if not url:
+        print(f"[cache] ID {poster_id}: No URL found in record!")
+        return existing_file
+
+    # Another record (or screen) already downloaded this URL: share its blob
+    if (cache_index.get(poster_id_str) or {}).get("url") != url:
+        donor = _entry_for_url(url, exclude=poster_id_str)
+        if donor:
+            _link(poster_id_str, donor, url)
+            print(f"[cache] ID {poster_id}: Same URL already cached, linked to {_stored_name(donor)}")
+            return get_image_path(poster_id_str)
+
+    if existing_file:
+        print(f"[cache] ID {poster_id}: Revalidating {existing_file.name} against {url}...")
+    else:
+        print(f"[cache] ID {poster_id}: Downloading from {url}...")
+
+    try:
+        # A partial the server no longer honours is dropped and fetched again once
+        for _ in range(2):
+            status, data_path, digest, validators = _fetch(poster_id, url, headers, timeout)
+            if status != "restart":
+                break
+
+        if status == "not_modified" and existing_file:
+            print(f"[cache] ID {poster_id}: Not modified, keeping {existing_file.name}")
+            cache_index.update(poster_id_str, checked_at=time.time())
+            return existing_file
+        if status != "done":
+            return existing_file
+        
+        # Identify format
+        try:
+            img = Image.open(data_path)
+            ext = (img.format or "PNG").lower()
+            width, height = img.size
+            if ext == "jpeg": ext = "jpg"
+            
+            # Close image before moving
+            img.close()
+            
+            sha256 = digest.hexdigest()
+            old = cache_index.get(poster_id_str) or {}
+            # Another download of the same content may be deriving (and
+            # dropping) the blob right now
+            with _digest_lock(sha256):
+                donor = next((e for e in map(cache_index.get, cache_index.find(sha256=sha256))
+                              if e and _stored_name(e) and (CACHE_DIR / _stored_name(e)).is_file()), None)
+                if donor:
+                    # Same content from another URL is already cached: share its files
+                    os.remove(data_path)
+                    _discard_partial(url)
+                    cache_index.update(poster_id_str, url=url, checked_at=time.time(), **validators,
+                                       **{key: donor.get(key) for key in FILE_FIELDS})
+                    print(f"[cache] ID {poster_id}: Same content already cached as {_stored_name(donor)}")
+                    path = _derive(poster_id_str)
+                else:
+                    name = _store_blob(data_path, sha256, ext)
+                    _discard_partial(url)
+                    final_path = CACHE_DIR / name
+                    cache_index.update(poster_id_str, path=name, format=ext,
+                                       size=final_path.stat().st_size, url=url, checked_at=time.time(),
+                                       sha256=sha256, width=width, height=height,
+                                       derived=None, derived_size=None, **validators)
+                    print(f"[cache] ID {poster_id}: Successfully saved as {name}")
+                    path = _ingest(poster_id_str, final_path, sha256)
+            if old.get("sha256") and old["sha256"] != sha256:
+                _release_blob(old["sha256"])
+            return path
+            
+        except Exception as img_err:
+            print(f"[cache] ID {poster_id}: Downloaded file is not a valid image. {img_err}")
+            _discard_partial(url)
+
+    except requests.exceptions.Timeout:
+        print(f"[cache] ID {poster_id}: Network/Write Error: Slow internet / request timed out after {timeout}s")
+        _keep_partial(poster_id, url)
+                
+    except Exception as e:
+        print(f"[cache] ID {poster_id}: Network/Write Error: {e}")
+        _keep_partial(poster_id, url)
+    return existing_file
+
+def download_records(records, timeout=REQUEST_TIMEOUT, progress=None):
+    """
+    Downloads missing images for records without deleting anything.
+    Up to DOWNLOAD_CONCURRENCY posters are fetched in parallel; cached
+    posters without a derivative for the current screen get one first.
+    progress(done, total) is called from the calling thread after each
+    download finishes. _sync_lock is only held while deciding what to
+    fetch. Returns the list of cached paths.
+    """
+    ensure_cache()
+    with _sync_lock:
+        pending, ready = {}, []
+        for poster in records or []:
+            poster_id = poster.get("PosterId") or poster.get("id")
+            if poster_id and not _needs_download(poster):
+                ready.append(str(poster_id))
+            elif poster_id:
+                # Duplicate ids would race on the same temp file
+                pending.setdefault(str(poster_id), poster)
+            else:
+                print("[cache] Skipping record with missing ID")
+
+        # Posters cached before this screen geometry was registered (one per content hash)
+        backfill = {}
+        for pid in ready:
+            entry = cache_index.get(pid) or {}
+            if _needs_derivative(entry):
+                backfill.setdefault(entry["sha256"], pid)
+
+    if backfill:
+        print(f"[cache] Rendering {len(backfill)} derivatives for {_display_geometry}")
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_CONCURRENCY, len(backfill))) as pool:
+            list(pool.map(_derive, backfill.values()))
+    cached_paths = [get_image_path(pid) for pid in ready]
+
+    if not pending:
+        return cached_paths
+
+    # Records sharing a URL are downloaded once; the rest link to that blob
+    first, followers = {}, []
+    for poster in pending.values():
+        url = poster.get("eposter_file") or poster.get("file")
+        if url and url in first:
+            followers.append(poster)
+        else:
+            first[url or id(poster)] = poster
+
+    total = len(pending)
+    print(f"[cache] Fetching {len(first)} posters ({DOWNLOAD_CONCURRENCY} parallel)")
+
+    def report(done):
+        if progress:
+            try:
+                progress(done, total)
+            except Exception as e:
+                print(f"[cache] Progress callback failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=min(DOWNLOAD_CONCURRENCY, len(first))) as pool:
+        futures = [pool.submit(download_poster, poster, timeout) for poster in first.values()]
+        for done, future in enumerate(as_completed(futures), 1):
+            path = future.result()
+            if path:
+                cached_paths.append(path)
+            report(done)
+    for done, poster in enumerate(followers, len(first) + 1):
+        path = download_poster(poster, timeout)
+        if path:
+            cached_paths.append(path)
+        report(done)
+    return cached_paths
+
+def scheduled_today(records, now=None):
+    """Ids of the records whose slot overlaps today (records without times count)."""
+    now = now or datetime.now()
+    day_start = datetime.combine(now.date(), datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    ids = set()
+    for r in records or []:
+        pid = r.get("PosterId") or r.get("id")
+        start, end = r.get("start_dt"), r.get("end_dt")
+        if pid and (start is None or end is None or (start < day_end and end >= day_start)):
+            ids.add(str(pid))
+    return ids
+
+def _last_used(entry):
+    return max(entry.get("last_seen", 0), entry.get("last_displayed", 0), entry.get("checked_at", 0))
+
+def _free_bytes():
+    try:
+        return shutil.disk_usage(CACHE_DIR).free
+    except OSError:
+        return CACHE_MIN_FREE
+
+
+def _sweep_partials(now):
+    """Deletes partial downloads nobody resumed within the grace period."""
+    if not PARTIAL_DIR.exists():
+        return
+    for path in PARTIAL_DIR.iterdir():
+        try:
+            if now - path.stat().st_mtime >= CACHE_GRACE_SECONDS:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def collect_garbage(pinned=(), now=None):
+    """
+    Evicts least recently used posters while the cache is over CACHE_BUDGET
+    or the disk has less than CACHE_MIN_FREE bytes free. Pinned ids and
+    posters used within CACHE_GRACE_SECONDS are never evicted.
+    Returns the evicted ids.
     """
-    Syncs cache directory. Downloads missing images.
+    now = now or time.time()
+    pinned = {str(pid) for pid in pinned}
+    with _sync_lock:
+        _sweep_partials(now)
+        entries = {pid: cache_index.get(pid) or {} for pid in cache_index.ids()}
+        # Rows whose file is gone only matter while the poster is still in use
+        stale = [pid for pid, e in entries.items()
+                 if not _stored_name(e) and pid not in pinned and now - _last_used(e) >= CACHE_GRACE_SECONDS]
+
+        # Content (original and derivative) is as recent as the most recent poster linking to it
+        blobs = {}
+        for pid, e in entries.items():
+            if not _stored_name(e) or not e.get("sha256"):
+                continue
+            size = e.get("size", 0) + e.get("derived_size", 0) + e.get("upright_size", 0)
+            blob = blobs.setdefault(e["sha256"], {"ids": [], "size": size, "last_used": 0, "pinned": False})
+            blob["ids"].append(pid)
+            blob["last_used"] = max(blob["last_used"], _last_used(e))
+            blob["pinned"] = blob["pinned"] or pid in pinned
+
+        over = sum(b["size"] for b in blobs.values()) - CACHE_BUDGET
+        short = CACHE_MIN_FREE - _free_bytes()
+        evicted = []
+        if over > 0 or short > 0:
+            candidates = sorted(
+                (digest for digest, b in blobs.items()
+                 if not b["pinned"] and now - b["last_used"] >= CACHE_GRACE_SECONDS),
+                key=lambda digest: blobs[digest]["last_used"])
+            for digest in candidates:
+                if over <= 0 and short <= 0:
+                    break
+                blob = blobs[digest]
+                print(f"[cache] Evicting {digest[:12]} (ids {', '.join(blob['ids'])})")
+                cache_index.remove(blob["ids"])
+                try:
+                    _release_blob(digest)
+                except Exception as e:
+                    print(f"[cache] Error evicting {digest[:12]}: {e}")
+                over, short = over - blob["size"], short - blob["size"]
+                evicted += blob["ids"]
+            if over > 0 or short > 0:
+                print("[cache] Cache still over budget; remaining posters are pinned or recently used")
+        cache_index.remove(stale)
+    return evicted
+
+def sync_cache(records, timeout=REQUEST_TIMEOUT, progress=None):
+    """
+    Syncs cache directory. Downloads missing images, then evicts old posters
+    only if the cache is over its byte budget or the disk is nearly full.
+    progress(done, total) is forwarded to download_records.
     """
     ensure_cache()
     print(f"--- SYNC START: Received {len(records) if records else 0} records ---")
@@ -54,90 +1008,19 @@ def sync_cache(records, timeout=REQUEST_TIMEOUT):
         pid = r.get("PosterId") or r.get("id")
         if pid:
             valid_ids.add(str(pid))
-            
-    # 2. Cleanup Old Files
-    print(f"[cache] Cleaning up files not in: {valid_ids}")
-    for f in CACHE_DIR.iterdir():
-        if f.is_file() and not f.name.startswith("."):
-            if f.stem not in valid_ids and "_temp" not in f.name:
-                try:
-                    print(f"[cache] Deleting old file: {f.name}")
-                    os.remove(f)
-                except Exception as e:
-                    print(f"[cache] Error deleting {f.name}: {e}")
 
-    # 3. Download Process
-    cached_paths = []
-    
-    for poster in records:
-        # Get ID
-        poster_id = poster.get("PosterId") or poster.get("id")
-        if not poster_id:
-            print("[cache] Skipping record with missing ID")
-            continue
-            
-        poster_id_str = str(poster_id)
-        
-        # Check if exists
-        existing_file = get_image_path(poster_id_str)
-        if existing_file:
-            print(f"[cache] ID {poster_id}: Found existing file ({existing_file.name}). Skipping download.")
-            cached_paths.append(existing_file)
-            continue
-
-        # Get URL
-        url = poster.get("eposter_file") or poster.get("file")
-        if not url:
-            print(f"[cache] ID {poster_id}: No URL found in record!")
-            continue
-
-        print(f"[cache] ID {poster_id}: Downloading from {url}...")
+    # 2. Posters in this list stay in their grace period; today's are pinned.
+    # Anything else is kept until space runs short (e.g. another device_id's).
+    with _sync_lock:
+        cache_index.mark_seen(valid_ids)
+        pinned = scheduled_today(records)
+        collect_garbage(pinned)
 
-        # Download
-        tmp_path = CACHE_DIR / f"{poster_id}_temp"
-        try:
-            # Added verify=False in case of SSL issues, but use with caution
-            r = requests.get(url, stream=True, timeout=timeout)
-            
-            if r.status_code != 200:
-                print(f"[cache] ID {poster_id}: Download Failed (Status code {r.status_code})")
-                continue
-
-            with open(tmp_path, "wb") as fh:
-                for chunk in r.iter_content(8192):
-                    if chunk:
-                        fh.write(chunk)
-            
-            # Identify format
-            try:
-                img = Image.open(tmp_path)
-                ext = (img.format or "PNG").lower()
-                if ext == "jpeg": ext = "jpg"
-                
-                final_path = CACHE_DIR / f"{poster_id_str}.{ext}"
-                
-                # Close image before moving
-                img.close()
-                
-                shutil.move(str(tmp_path), str(final_path))
-                print(f"[cache] ID {poster_id}: Successfully saved as {final_path.name}")
-                cached_paths.append(final_path)
-                
-            except Exception as img_err:
-                print(f"[cache] ID {poster_id}: Downloaded file is not a valid image. {img_err}")
-                if tmp_path.exists(): os.remove(tmp_path)
-
-        except requests.exceptions.Timeout:
-            print(f"[cache] ID {poster_id}: Network/Write Error: Slow internet / request timed out after {timeout}s")
-            if tmp_path.exists():
-                try: os.remove(tmp_path)
-                except: pass
-                    
-        except Exception as e:
-            print(f"[cache] ID {poster_id}: Network/Write Error: {e}")
-            if tmp_path.exists():
-                try: os.remove(tmp_path)
-                except: pass
+    # 3. Download Process (takes _sync_lock only while planning)
+    cached_paths = download_records(records, timeout, progress)
+    with _sync_lock:
+        cache_index.mark_seen(valid_ids)
+        collect_garbage(pinned)
     
     print(f"--- SYNC END: {len(cached_paths)} images ready ---")
     return cached_paths
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+cache_index.py
+
+Manifest of eposter_cache: one row per poster id linking it to a
+content-addressed blob and its display-ready derivative, with format, size,
+content hash, source URL, HTTP validators (ETag / Last-Modified) and when it
+was last displayed.
+Stored in SQLite as eposter_cache/.manifest.db and mirrored in memory, so
+lookups never touch the filesystem; changes are written through in a
+transaction. The first start adopts the images already in the directory.
+"""
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+SCRIPT_DIR = Path(__file__).parent
+CACHE_DIR = SCRIPT_DIR / "eposter_cache"
+MANIFEST_FILE = CACHE_DIR / ".manifest.db"
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "bmp", "gif")
+SCHEMA_VERSION = 1
+
+# Columns besides the poster id; paths are relative to CACHE_DIR. path is the
+# original ("blobs/<sha256>.<ext>", unset once dropped), derived the frame for
+# the screen ("derived/<sha256>_<w>x<h>_r<rotation>.jpg"), upright the copy
+# kept in place of a dropped original ("derived/<sha256>_upright.jpg")
+COLUMNS = {
+    "path": "TEXT", "format": "TEXT", "size": "INTEGER", "sha256": "TEXT",
+    "derived": "TEXT", "derived_size": "INTEGER", "upright": "TEXT", "upright_size": "INTEGER",
+    "url": "TEXT", "etag": "TEXT", "last_modified": "TEXT", "checked_at": "REAL",
+    "width": "INTEGER", "height": "INTEGER", "last_displayed": "REAL",
+    "last_seen": "REAL",  # last sync whose record list included the poster
+}
+
+_lock = threading.RLock()
+_entries = None
+_rebuilt = False  # entries come from a directory scan, not a stored manifest
+_conn = None
+_displayed = {}  # last_displayed times not yet written to disk
+
+
+def _connect():
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(MANIFEST_FILE), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS posters (id TEXT PRIMARY KEY, {columns})")
+    # Manifests created by older versions lack the newer columns
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(posters)")}
+    for name, kind in COLUMNS.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE posters ADD COLUMN {name} {kind}")
+    return conn
+
+
+def _scan_directory():
+    """
+    Builds entries for the <id>.<ext> images already in CACHE_DIR (one-off,
+    on migration). Blobs and derivatives carry no poster id, so they are
+    not adopted; see rebuilt().
+    """
+    entries = {}
+    try:
+        files = [f for f in CACHE_DIR.iterdir() if f.is_file() and not f.name.startswith(".")]
+    except FileNotFoundError:
+        return entries
+    for f in sorted(files):
+        ext = f.suffix.lower().lstrip(".")
+        if ext not in IMAGE_EXTENSIONS or f.stem in entries:
+            continue
+        entries[f.stem] = {"path": f.name, "format": ext, "size": f.stat().st_size}
+    return entries
+
+
+def _migrate(conn):
+    """Seeds an empty manifest from the files on disk."""
+    entries = _scan_directory()
+    with conn:
+        for pid, fields in entries.items():
+            _write(conn, pid, fields)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    print(f"[cache_index] Manifest created with {len(entries)} posters")
+
+
+def _load():
+    global _entries, _conn, _rebuilt
+    if _entries is not None:
+        return _entries
+    try:
+        _conn = _connect()
+        if _conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            _migrate(_conn)
+            _rebuilt = True
+        rows = _conn.execute(f"SELECT id, {', '.join(COLUMNS)} FROM posters")
+        _entries = {row[0]: {k: v for k, v in zip(COLUMNS, row[1:]) if v is not None} for row in rows}
+    except Exception as e:
+        # Keep working from memory; nothing is written until a start opens the manifest
+        print(f"[cache_index] Manifest unavailable, using a directory scan: {e}")
+        _conn = None
+        _entries = _scan_directory()
+        _rebuilt = True
+    return _entries
+
+
+def rebuilt():
+    """
+    True when this run's entries were rebuilt from a directory scan (new
+    or unreadable manifest). Files in the cache may then belong to posters
+    the manifest no longer knows about, so nothing should be deleted as
+    unreferenced.
+    """
+    with _lock:
+        _load()
+        return _rebuilt
+
+
+def _write(conn, poster_id, fields):
+    cols = [c for c in fields if c in COLUMNS]
+    if not cols:
+        conn.execute("INSERT OR IGNORE INTO posters (id) VALUES (?)", (poster_id,))
+        return
+    conn.execute(
+        f"INSERT INTO posters (id, {', '.join(cols)}) VALUES (?{', ?' * len(cols)}) "
+        f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in cols)}",
+        [poster_id] + [fields[c] for c in cols])
+
+
+def get(poster_id):
+    """Returns a copy of the entry for poster_id, or None."""
+    with _lock:
+        entry = _load().get(str(poster_id))
+        return dict(entry) if entry else None
+
+
+def ids():
+    """Returns the ids of every poster in the manifest."""
+    with _lock:
+        return list(_load())
+
+
+def find(**fields):
+    """Returns the ids whose entries match every given field."""
+    with _lock:
+        return [pid for pid, entry in _load().items()
+                if all(entry.get(key) == value for key, value in fields.items())]
+
+
+def update(poster_id, **fields):
+    """
+    Merges fields (names from COLUMNS) into the entry for poster_id and
+    writes them through. A value of None clears that field.
+    """
+    unknown = set(fields) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown manifest fields: {', '.join(sorted(unknown))}")
+    with _lock:
+        entry = _load().setdefault(str(poster_id), {})
+        for key, value in fields.items():
+            if value is None: entry.pop(key, None)
+            else: entry[key] = value
+        if _conn is None:
+            return
+        try:
+            with _conn:
+                _write(_conn, str(poster_id), fields)
+        except Exception as e:
+            print(f"[cache_index] Failed to write {poster_id}: {e}")
+
+
+def remove(poster_ids):
+    """Drops the entries for poster_ids."""
+    with _lock:
+        entries = _load()
+        removed = [str(pid) for pid in poster_ids if entries.pop(str(pid), None) is not None]
+        for pid in removed:
+            _displayed.pop(pid, None)
+        if not removed or _conn is None:
+            return
+        try:
+            with _conn:
+                _conn.executemany("DELETE FROM posters WHERE id = ?", [(pid,) for pid in removed])
+        except Exception as e:
+            print(f"[cache_index] Failed to remove entries: {e}")
+
+
+def mark_seen(poster_ids, when=None):
+    """Sets last_seen for the cached posters among poster_ids in one transaction."""
+    when = when or time.time()
+    with _lock:
+        entries = _load()
+        seen = [str(pid) for pid in poster_ids if str(pid) in entries]
+        for pid in seen:
+            entries[pid]["last_seen"] = when
+        if not seen or _conn is None:
+            return
+        try:
+            with _conn:
+                _conn.executemany("UPDATE posters SET last_seen = ? WHERE id = ?", [(when, pid) for pid in seen])
+        except Exception as e:
+            print(f"[cache_index] Failed to save last_seen: {e}")
+
+
+def touch(poster_id, when=None):
+    """
+    Records that a poster was just displayed. Kept in memory until flush()
+    so a slideshow does not write to the SD card on every slide.
+    """
+    with _lock:
+        entry = _load().get(str(poster_id))
+        if entry is None:
+            return
+        entry["last_displayed"] = _displayed[str(poster_id)] = when or time.time()
+
+
+def flush():
+    """Writes pending last_displayed times in one transaction."""
+    with _lock:
+        if not _displayed or _conn is None:
+            _displayed.clear()
+            return
+        pending = list(_displayed.items())
+        _displayed.clear()
+        try:
+            with _conn:
+                _conn.executemany("UPDATE posters SET last_displayed = ? WHERE id = ?",
+                                  [(when, pid) for pid, when in pending])
+        except Exception as e:
+            print(f"[cache_index] Failed to save display times: {e}")
+
+
+def conditional_headers(entry):
+    """Builds If-None-Match / If-Modified-Since headers from an entry."""
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def validators(response):
+    """Extracts the validators worth storing from an HTTP response."""
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
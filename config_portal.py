@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
+import copy
 import json
 import os
-import socket
 import time
 import subprocess
 from pathlib import Path
-from flask import Flask, request, redirect, render_template_string, jsonify, session, url_for
+from io import BytesIO
+from flask import Flask, request, redirect, render_template_string, jsonify, session, url_for, Response
+from PIL import Image
+
+import file_utils
+import frame_buffer
+import network_service
 
 # --- Config ---
 PROJECT_DIR = Path(__file__).parent
@@ -353,16 +359,8 @@ HTML_TEMPLATE = """
 
 # --- Helper: Get IP Address ---
 def get_ip():
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        # Doesn't actually connect, just used to find local IP
-        s.connect(('8.8.8.8', 1))
-        IP = s.getsockname()[0]
-    except Exception:
-        IP = '127.0.0.1'
-    finally:
-        s.close()
-    return IP
+    # Cached; network_service re-probes on netlink address/link events
+    return network_service.get_ip()
 
 # --- Passive Wi-Fi Check ---
 def wait_for_wifi(timeout_interval=5):
@@ -381,6 +379,8 @@ def wait_for_wifi(timeout_interval=5):
             time.sleep(timeout_interval)
 
 # --- Config Management ---
+_last_good_config = {}
+
 def load_config():
     default_config = {
         "ID": 0,
@@ -405,8 +405,12 @@ def load_config():
         for key in default_config:
             if key not in data:
                 data[key] = default_config[key]
-        return data
+        _last_good_config['data'] = data
+        return copy.deepcopy(data)
     except Exception:
+        # Never fall back to defaults (and save them) over a real config
+        if 'data' in _last_good_config:
+            return copy.deepcopy(_last_good_config['data'])
         return default_config
 
 # --- Web Routes ---
@@ -463,8 +467,7 @@ def save():
         conf['wifi']['password2'] = request.form.get('pass2')
         conf['api']['poster_api_url'] = request.form.get('poster_api_url')
         
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(conf, f, indent=2)
+        file_utils.atomic_write_json(CONFIG_FILE, conf, indent=2)
         
         return jsonify({'success': True, 'message': 'Settings saved successfully!'})
     except Exception as e:
@@ -527,6 +530,55 @@ def toggle_powersave():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+# Encoded snapshots of the current frame, keyed by (seq, format, width)
+SNAPSHOT_FORMATS = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+_snapshot_cache = {}
+
+@app.route('/snapshot', methods=['GET'])
+def snapshot():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    fmt = request.args.get('format', 'jpeg').lower()
+    if fmt == 'jpg': fmt = 'jpeg'
+    if fmt not in SNAPSHOT_FORMATS:
+        return jsonify({'success': False, 'message': f'Unsupported format: {fmt}'}), 400
+    try:
+        width = int(request.args.get('width', 0))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid width'}), 400
+
+    header = frame_buffer.read_header()
+    if header is None:
+        return jsonify({'success': False, 'message': 'No frame displayed yet'}), 404
+    frame_w = header[0]
+    width = frame_w if width <= 0 else min(width, frame_w)
+
+    etag = f'"{header[2]}-{fmt}-{width}"'
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers={'ETag': etag})
+
+    key = (header[2], fmt, width)
+    if key not in _snapshot_cache:
+        frame = frame_buffer.read_frame()
+        if frame is None:
+            return jsonify({'success': False, 'message': 'Frame unavailable, try again'}), 503
+        w, h, seq, rgb = frame
+        img = Image.frombuffer('RGB', (w, h), rgb, 'raw', 'RGB', 0, 1)
+        if width < w:
+            img = img.resize((width, max(1, h * width // w)), Image.LANCZOS)
+        buf = BytesIO()
+        img.save(buf, format=fmt.upper(), quality=85)
+        key = (seq, fmt, width)
+        etag = f'"{seq}-{fmt}-{width}"'
+        # Only the current frame is worth keeping
+        for old in [k for k in _snapshot_cache if k[0] != seq]:
+            del _snapshot_cache[old]
+        _snapshot_cache[key] = buf.getvalue()
+
+    return Response(_snapshot_cache[key], mimetype=SNAPSHOT_FORMATS[fmt],
+                    headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
 # --- Main Entry ---
 if __name__ == '__main__':
     # 1. Wait for Wi-Fi (Passive Mode)
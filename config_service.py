@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+config_service.py
+
+Shared in-memory snapshot of config.json for the display process.
+A watcher thread follows the file with inotify (falling back to stat
+polling where inotify is unavailable) and re-parses it only when it was
+rewritten. Subscribers are told which watched keys changed.
+"""
+from pathlib import Path
+from collections import namedtuple
+import os
+import json
+import time
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+SCRIPT_DIR = Path(__file__).parent
+CONFIG_FILE = SCRIPT_DIR / 'config.json'
+POLL_INTERVAL = 1.0      # seconds between stats in polling mode
+RESCAN_INTERVAL = 30.0   # safety re-stat while waiting on inotify
+
+# Display keys pushed to subscribers, with the type their value is coerced to
+WATCHED_KEYS = {
+    "Mode": str,
+    "device_id": str,
+    "rotation_degree": int,
+    "Auto_Scroll": int,
+}
+
+ConfigChange = namedtuple("ConfigChange", ["key", "old", "new"])
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+_EVENT_HEADER = struct.Struct("iIII")
+
+_lock = threading.Lock()
+_state = {"config": None, "stat": None, "thread": None}
+_subscribers = []
+
+
+def _file_stat():
+    try:
+        st = CONFIG_FILE.stat()
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _watched_values(cfg):
+    values = {}
+    display = cfg.get("display", {}) if isinstance(cfg, dict) else {}
+    for key, cast in WATCHED_KEYS.items():
+        value = display.get(key)
+        try:
+            values[key] = cast(value) if value is not None else None
+        except (TypeError, ValueError):
+            values[key] = value
+    return values
+
+
+def reload():
+    """
+    Re-reads config.json. A file that is missing or fails to parse keeps the
+    last good snapshot. Returns the list of ConfigChange for watched keys.
+    """
+    stat = _file_stat()
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            cfg = json.load(f)
+        if not isinstance(cfg, dict):
+            raise ValueError("config root is not an object")
+    except Exception as e:
+        print(f"[config] Keeping last good config, read failed: {e}")
+        with _lock:
+            # Retry once the file changes again (a torn write completes)
+            _state["stat"] = stat
+            if _state["config"] is None:
+                _state["config"] = {}
+        return []
+
+    with _lock:
+        old = _state["config"]
+        _state["config"] = cfg
+        _state["stat"] = stat
+    if old is None:
+        return []
+
+    before, after = _watched_values(old), _watched_values(cfg)
+    changes = [ConfigChange(k, before[k], after[k]) for k in WATCHED_KEYS if before[k] != after[k]]
+    if changes:
+        print(f"[config] Changed: {', '.join(f'{c.key}={c.new}' for c in changes)}")
+        for callback in list(_subscribers):
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"[config] Subscriber failed: {e}")
+    return changes
+
+
+def _reload_if_changed():
+    if _file_stat() != _state["stat"]:
+        reload()
+
+
+def _inotify_fd():
+    """Returns an inotify fd watching the config directory, or None."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        # Watch the directory so atomic replace-by-rename is seen too
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(fd, str(CONFIG_FILE.parent).encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except Exception as e:
+        print(f"[config] inotify unavailable: {e}")
+        return None
+
+
+def _names_in(buf):
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(buf):
+        _, _, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+        offset += _EVENT_HEADER.size
+        yield buf[offset:offset + length].rstrip(b"\0")
+        offset += length
+
+
+def _watch():
+    fd = _inotify_fd()
+    if fd is None:
+        print("[config] Watching config.json by polling")
+        while True:
+            time.sleep(POLL_INTERVAL)
+            _reload_if_changed()
+
+    print("[config] Watching config.json with inotify")
+    name = CONFIG_FILE.name.encode()
+    while True:
+        ready, _, _ = select.select([fd], [], [], RESCAN_INTERVAL)
+        if ready:
+            if name in _names_in(os.read(fd, 4096)):
+                _reload_if_changed()
+        else:
+            _reload_if_changed()
+
+
+def start():
+    """Loads the snapshot and starts the watcher thread once."""
+    with _lock:
+        needs_load = _state["config"] is None
+    if needs_load:
+        reload()
+    with _lock:
+        if _state["thread"] is None:
+            _state["thread"] = threading.Thread(target=_watch, name="config-watch", daemon=True)
+            _state["thread"].start()
+
+
+def get():
+    """Returns the current parsed config. Treat it as read-only."""
+    if _state["thread"] is None:
+        start()
+    return _state["config"]
+
+
+def subscribe(callback):
+    """Registers callback(changes) for changes to WATCHED_KEYS."""
+    start()
+    _subscribers.append(callback)
@@ -5,23 +5,126 @@ display_handler.py
 Handles displaying poster images and status messages using pygame.
 """
 from pathlib import Path
+from collections import OrderedDict
 import os
 import time
-import json
 from PIL import Image
 import pygame
-import socket
+
+import render_cache
+import cache_handler
+import config_service
+import frame_buffer
+import network_service
 
 def get_local_ip():
-    """Dynamically find the local IP address."""
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except:
-        return "127.0.0.1"
+    """Returns the local IP address cached by network_service."""
+    return network_service.get_ip()
+
+# Fonts resolved once per (family, size, bold); SysFont scans system fonts
+_fonts = {}
+# Rendered/rotated text and overlay bars, most recently used last
+TEXT_CACHE_SIZE = 64
+_text_cache = OrderedDict()
+# Blit times per kind of surface, logged every BLIT_REPORT_SECONDS while
+# display.blit_stats is enabled in config.json
+BLIT_REPORT_SECONDS = 60
+_blit_stats = {"since": time.monotonic(), "kinds": {}}
+
+def get_font(family, size, bold=False):
+    """Returns a cached pygame Font for (family, size, bold)."""
+    key = (family.lower(), int(size), bool(bold))
+    font = _fonts.get(key)
+    if font is None:
+        font = _fonts[key] = pygame.font.SysFont(family, int(size), bold=bold)
+    return font
+
+def to_display_format(surf):
+    """
+    Returns surf in the display's pixel format, so blitting it is a plain
+    copy: convert_alpha() for per-pixel alpha, convert() otherwise.
+    Surfaces made before the display exists are returned unchanged.
+    """
+    if pygame.display.get_surface() is None:
+        return surf
+    if surf.get_flags() & pygame.SRCALPHA:
+        return surf.convert_alpha()
+    return surf.convert()
+
+def timed_blit(screen, surf, pos, kind):
+    """
+    screen.blit(surf, pos) that, with display.blit_stats on, records how
+    long it took under kind and logs count / average / max per kind.
+    """
+    if not (config_service.get() or {}).get("display", {}).get("blit_stats"):
+        return screen.blit(surf, pos)
+    start = time.perf_counter()
+    rect = screen.blit(surf, pos)
+    elapsed = (time.perf_counter() - start) * 1000
+    count, total, worst = _blit_stats["kinds"].get(kind, (0, 0.0, 0.0))
+    _blit_stats["kinds"][kind] = (count + 1, total + elapsed, max(worst, elapsed))
+    if time.monotonic() - _blit_stats["since"] >= BLIT_REPORT_SECONDS:
+        report = ", ".join(f"{name} {n}x avg {t / n:.2f} max {m:.2f}"
+                           for name, (n, t, m) in sorted(_blit_stats["kinds"].items()))
+        print(f"[display] Blit ms: {report}")
+        _blit_stats["since"], _blit_stats["kinds"] = time.monotonic(), {}
+    return rect
+
+def _cached_surface(key, build):
+    """
+    LRU lookup for rendered surfaces; build() runs only on a miss and its
+    surface (or (surface, pos)) is converted to the display format once.
+    """
+    value = _text_cache.get(key)
+    if value is not None:
+        _text_cache.move_to_end(key)
+        return value
+    value = build()
+    if isinstance(value, tuple):
+        value = (to_display_format(value[0]),) + value[1:]
+    else:
+        value = to_display_format(value)
+    _text_cache[key] = value
+    while len(_text_cache) > TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return value
+
+def render_text(text, family, size, bold=False, colour=(255, 255, 255), rotation=0):
+    """Renders (and rotates) a line of text once per (text, font, colour, rotation)."""
+    def build():
+        surf = get_font(family, size, bold).render(text, True, colour)
+        if rotation != 0:
+            surf = pygame.transform.rotate(surf, -rotation)
+        return surf
+    return _cached_surface(("text", text, family.lower(), int(size), bool(bold), colour, rotation), build)
+
+def _place_bar(bar_surface, scr_w, scr_h, rotation=0):
+    """Rotates a logical bottom bar and returns (surface, screen position)."""
+    bar_height = bar_surface.get_height()
+    if rotation == 0:
+        return bar_surface, (0, scr_h - bar_height)
+    rotated_bar = pygame.transform.rotate(bar_surface, -rotation)
+    if rotation == 90:
+        return rotated_bar, (0, 0)
+    elif rotation == 180:
+        return rotated_bar, (0, 0)
+    elif rotation == 270:
+        return rotated_bar, (scr_w - rotated_bar.get_width(), 0)
+    return rotated_bar, (0, scr_h - bar_height)
+
+def rotate_rect(rect, scr_w, scr_h, rotation=0):
+    """
+    Maps a rect in the logical (rotated) UI onto physical screen
+    coordinates, matching pygame.transform.rotate(surface, -rotation).
+    """
+    x, y, w, h = rect
+    if rotation == 90:
+        return pygame.Rect(scr_w - y - h, x, h, w)
+    elif rotation == 180:
+        return pygame.Rect(scr_w - x - w, scr_h - y - h, w, h)
+    elif rotation == 270:
+        return pygame.Rect(y, scr_h - x - w, h, w)
+    return pygame.Rect(x, y, w, h)
 
 def display_url(screen, scr_w, scr_h, rotation=0, poster_id=None):
     """
@@ -29,49 +132,32 @@ def display_url(screen, scr_w, scr_h, rotation=0, poster_id=None):
     Removed .flip() to prevent flickering.
     """
     try:
-        import socket
-        def get_local_ip():
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                s.connect(("8.8.8.8", 80))
-                ip = s.getsockname()[0]
-                s.close()
-                return ip
-            except: return "127.0.0.1"
-
         ip_addr = get_local_ip()
         url_text = f"{ip_addr}"
         poster_text = f"Paper ID: {poster_id}" if poster_id else ""
-        font = pygame.font.SysFont("Arial", 16, bold=True)
-        
-        if rotation in [90, 270]:
-            logical_w = scr_h
-        else:
-            logical_w = scr_w
 
-        bar_height = 25
-        bar_surface = pygame.Surface((logical_w, bar_height), pygame.SRCALPHA)
-        bar_surface.set_alpha(230)
-        
-        if poster_text:
-            left_surf = font.render(poster_text, True, (90, 90, 90))
-            bar_surface.blit(left_surf, (10, (bar_height - left_surf.get_height()) // 2))
-        
-        right_surf = font.render(url_text, True, (90, 90, 90))
-        bar_surface.blit(right_surf, (logical_w - right_surf.get_width() - 10, (bar_height - right_surf.get_height()) // 2))
-        
-        if rotation == 0:
-            screen.blit(bar_surface, (0, scr_h - bar_height))
-        else:
-            rotated_bar = pygame.transform.rotate(bar_surface, -rotation)
-            if rotation == 90:
-                screen.blit(rotated_bar, (0, 0))
-            elif rotation == 180:
-                screen.blit(rotated_bar, (0, 0))
-            elif rotation == 270:
-                screen.blit(rotated_bar, (scr_w - rotated_bar.get_width(), 0))
+        def build():
+            font = get_font("Arial", 16, bold=True)
+            
+            if rotation in [90, 270]:
+                logical_w = scr_h
             else:
-                screen.blit(rotated_bar, (0, scr_h - bar_height))
+                logical_w = scr_w
+
+            bar_height = 25
+            bar_surface = pygame.Surface((logical_w, bar_height), pygame.SRCALPHA)
+            bar_surface.set_alpha(230)
+            
+            if poster_text:
+                left_surf = font.render(poster_text, True, (90, 90, 90))
+                bar_surface.blit(left_surf, (10, (bar_height - left_surf.get_height()) // 2))
+            
+            right_surf = font.render(url_text, True, (90, 90, 90))
+            bar_surface.blit(right_surf, (logical_w - right_surf.get_width() - 10, (bar_height - right_surf.get_height()) // 2))
+            return _place_bar(bar_surface, scr_w, scr_h, rotation)
+
+        bar, pos = _cached_surface(("url", poster_text, url_text, scr_w, scr_h, rotation), build)
+        timed_blit(screen, bar, pos, "url_bar")
         # NO FLIP HERE
     except Exception as e:
         print(f"[display] Error overlaying URL: {e}")
@@ -79,41 +165,82 @@ def display_url(screen, scr_w, scr_h, rotation=0, poster_id=None):
     
 def get_rotation_degree():
     """
-    Get the current rotation degree from config file.
-    Reloads config each time to ensure fresh value.
+    Get the current rotation degree from the shared config snapshot.
+    config_service keeps it fresh, so no file read happens here.
     """
     try:
-        config_path = Path(__file__).parent / 'config.json'
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+        config = config_service.get() or {}
         rotation = int(config.get('display', {}).get('rotation_degree', 0))
         return rotation
     except Exception as e:
         print(f"[display] Error reading rotation from config: {e}")
         return 0
 
-def make_landscape_and_fit(img: Image.Image, target_w: int, target_h: int, rotation: int = 0) -> Image.Image:
-    """Rotates image and fits it to target dimensions."""
-    iw, ih = img.size
-    if rotation != 0:
+def fit_image(img: Image.Image, target_w: int, target_h: int, rotation: int = 0) -> Image.Image:
+    """
+    Rotates image and scales it to fit target dimensions, without a canvas.
+    Returns RGB, or RGBA when the image has transparency.
+    """
+    mode = "RGBA" if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info else "RGB"
+    if img.mode != mode:
+        img = img.convert(mode)
+    if rotation % 90:
         # Expand=True allows the canvas to grow to hold the rotated image
         img = img.rotate(rotation, expand=True)
-        iw, ih = img.size
-        
+        rotation = 0
+
+    # Quarter turns are a transpose, so scale first and turn the smaller image
+    iw, ih = img.size[::-1] if rotation % 180 else img.size
     scale = min(target_w / iw, target_h / ih)
     nw = max(1, int(iw * scale))
     nh = max(1, int(ih * scale))
-    
-    resized = img.resize((nw, nh), Image.LANCZOS)
-    canvas = Image.new("RGBA", (target_w, target_h), (0, 0, 0, 255))
-    x = (target_w - nw) // 2
-    y = (target_h - nh) // 2
-    canvas.paste(resized, (x, y))
+    img = img.resize((nh, nw) if rotation % 180 else (nw, nh), Image.LANCZOS)
+    if rotation % 360:
+        img = img.rotate(rotation, expand=True)
+    return img
+
+def make_landscape_and_fit(img: Image.Image, target_w: int, target_h: int, rotation: int = 0) -> Image.Image:
+    """Rotates image and fits it to target dimensions on a black RGB canvas."""
+    fitted = fit_image(img, target_w, target_h, rotation)
+    canvas = Image.new("RGB", (target_w, target_h), (0, 0, 0))
+    x = (target_w - fitted.width) // 2
+    y = (target_h - fitted.height) // 2
+    # Opaque images are copied as they are; transparent ones composited onto black
+    canvas.paste(fitted, (x, y), fitted if fitted.mode == "RGBA" else None)
     return canvas
 
+def open_for_screen(image_path, scr_w, scr_h, rotation=0) -> Image.Image:
+    """Opens an image decoded no larger than needed to fill the screen at rotation."""
+    box = (scr_h, scr_w) if rotation % 180 else (scr_w, scr_h)
+    return cache_handler.open_image(image_path, box)
+
+def compose_frame(img: Image.Image, scr_w, scr_h, rotation=0) -> Image.Image:
+    """Fits an image to the screen at rotation over a black background (RGB)."""
+    return make_landscape_and_fit(img, scr_w, scr_h, rotation=-rotation)
+
 def pil_to_surface(pil_img: Image.Image):
-    """Converts PIL Image to pygame Surface."""
-    return pygame.image.fromstring(pil_img.tobytes(), pil_img.size, pil_img.mode)
+    """
+    Converts PIL Image to pygame Surface. The pixels are packed once and
+    shared by frombuffer instead of copied again by fromstring; RGB is
+    packed as RGBX, which is how PIL holds it in memory.
+    """
+    if pil_img.mode not in ("RGB", "RGBA"):
+        pil_img = pil_img.convert("RGBA")
+    mode = "RGBA" if pil_img.mode == "RGBA" else "RGBX"
+    return pygame.image.frombuffer(pil_img.tobytes("raw", mode), pil_img.size, mode)
+
+def frame_surface(img: Image.Image, scr_w, scr_h, rotation=0):
+    """
+    Builds the screen-ready Surface for an image in the display's pixel
+    format. The fitted image is handed over without a canvas and blitted
+    once onto black, which also converts it to the display format; only
+    images with transparency are alpha blended.
+    """
+    fitted = fit_image(img, scr_w, scr_h, rotation=-rotation)
+    frame = pygame.Surface((scr_w, scr_h))
+    frame.fill((0, 0, 0))
+    frame.blit(pil_to_surface(fitted), ((scr_w - fitted.width) // 2, (scr_h - fitted.height) // 2))
+    return frame
 
 def init_display():
     """Initializes pygame display in fullscreen mode."""
@@ -143,41 +270,45 @@ def show_waiting_message(screen, scr_w, scr_h, message="Waiting...", rotation=0)
     """
     screen.fill((0, 0, 0))
     try:
-        font = pygame.font.SysFont("Arial", 32, bold=True)
-        lines = message.split('\n')
-        
-        # 1. Render all lines to surfaces
-        rendered_lines = [font.render(line, True, (255, 255, 255)) for line in lines]
-        
-        # 2. Calculate dimensions of the text block
-        max_w = max(s.get_width() for s in rendered_lines) if rendered_lines else 0
-        total_h = sum(s.get_height() for s in rendered_lines) + (5 * (len(lines) - 1)) # 5px padding
-        
-        # 3. Create a transparent container for the text
-        text_container = pygame.Surface((max_w, total_h), pygame.SRCALPHA)
-        
-        # 4. Blit lines onto container centered
-        current_y = 0
-        for s in rendered_lines:
-            x_pos = (max_w - s.get_width()) // 2
-            text_container.blit(s, (x_pos, current_y))
-            current_y += s.get_height() + 5
+        def build():
+            font = get_font("Arial", 32, bold=True)
+            lines = message.split('\n')
             
-        # 5. Rotate the entire container
-        # Pygame rotates counter-clockwise, so we use negative rotation
-        if rotation != 0:
-            text_container = pygame.transform.rotate(text_container, -rotation)
+            # 1. Render all lines to surfaces
+            rendered_lines = [font.render(line, True, (255, 255, 255)) for line in lines]
+            
+            # 2. Calculate dimensions of the text block
+            max_w = max(s.get_width() for s in rendered_lines) if rendered_lines else 0
+            total_h = sum(s.get_height() for s in rendered_lines) + (5 * (len(lines) - 1)) # 5px padding
+            
+            # 3. Create a transparent container for the text
+            text_container = pygame.Surface((max_w, total_h), pygame.SRCALPHA)
+            
+            # 4. Blit lines onto container centered
+            current_y = 0
+            for s in rendered_lines:
+                x_pos = (max_w - s.get_width()) // 2
+                text_container.blit(s, (x_pos, current_y))
+                current_y += s.get_height() + 5
+                
+            # 5. Rotate the entire container
+            # Pygame rotates counter-clockwise, so we use negative rotation
+            if rotation != 0:
+                text_container = pygame.transform.rotate(text_container, -rotation)
+            return text_container
+
+        text_container = _cached_surface(("waiting", message, rotation), build)
             
         # 6. Center the rotated container on the main screen
         final_rect = text_container.get_rect(center=(scr_w // 2, scr_h // 2))
-        screen.blit(text_container, final_rect)
+        timed_blit(screen, text_container, final_rect, "message")
         
         pygame.display.flip()
     except Exception as e:
         print(f"[display] Error showing waiting message: {e}")
         pygame.display.flip()
 
-def _draw_status_bar(screen, scr_w, scr_h, message, rotation=0):
+def _build_status_bar(scr_w, scr_h, message, rotation=0):
     if rotation in [90, 270]:
         logical_w = scr_h
         logical_h = scr_w
@@ -191,14 +322,14 @@ def _draw_status_bar(screen, scr_w, scr_h, message, rotation=0):
 
     lines = message.split('\n') if message else []
     font_size = max(14, int(bar_height * 0.18))
-    font = pygame.font.SysFont("Arial", font_size, bold=True)
+    font = get_font("Arial", font_size, bold=True)
     text_color = (210, 210, 210)
     rendered = [font.render(line, True, text_color) for line in lines]
     total_h = sum(s.get_height() for s in rendered) + (4 * (len(rendered) - 1))
 
     while rendered and total_h > bar_height - 10 and font_size > 12:
         font_size -= 2
-        font = pygame.font.SysFont("Arial", font_size, bold=True)
+        font = get_font("Arial", font_size, bold=True)
         rendered = [font.render(line, True, text_color) for line in lines]
         total_h = sum(s.get_height() for s in rendered) + (4 * (len(rendered) - 1))
 
@@ -208,58 +339,87 @@ def _draw_status_bar(screen, scr_w, scr_h, message, rotation=0):
         bar_surface.blit(surf, (x, y))
         y += surf.get_height() + 4
 
-    if rotation == 0:
-        screen.blit(bar_surface, (0, scr_h - bar_height))
-    else:
-        rotated_bar = pygame.transform.rotate(bar_surface, -rotation)
-        if rotation == 90:
-            screen.blit(rotated_bar, (0, 0))
-        elif rotation == 180:
-            screen.blit(rotated_bar, (0, 0))
-        elif rotation == 270:
-            screen.blit(rotated_bar, (scr_w - rotated_bar.get_width(), 0))
-        else:
-            screen.blit(rotated_bar, (0, scr_h - bar_height))
+    return _place_bar(bar_surface, scr_w, scr_h, rotation)
+
+def _draw_status_bar(screen, scr_w, scr_h, message, rotation=0):
+    bar, pos = _cached_surface(("status", message, scr_w, scr_h, rotation),
+                               lambda: _build_status_bar(scr_w, scr_h, message, rotation))
+    timed_blit(screen, bar, pos, "status_bar")
+
+# Decoded and fitted screensaver, reused until path/mtime/size/rotation change
+_screensaver_cache = {"key": None, "surface": None}
+
+def _get_screensaver_surface(image_path, scr_w, scr_h, rotation=0):
+    """Returns the fitted screensaver Surface, decoding the file only once."""
+    try:
+        mtime = Path(image_path).stat().st_mtime_ns
+    except OSError:
+        return None
+    key = (str(image_path), mtime, scr_w, scr_h, rotation)
+    if _screensaver_cache["key"] != key:
+        with open_for_screen(image_path, scr_w, scr_h, rotation) as img:
+            _screensaver_cache["surface"] = frame_surface(img, scr_w, scr_h, rotation)
+        _screensaver_cache["key"] = key
+    return _screensaver_cache["surface"]
 
 def show_screensaver_message(screen, scr_w, scr_h, message="Waiting...", rotation=0, image_path=None):
-    screen.fill((0, 0, 0))
     try:
         if image_path is None:
             image_path = Path(__file__).parent / "ScreenSaver.png"
 
-        if Path(image_path).exists():
-            img = Image.open(image_path).convert("RGBA")
-            canvas = make_landscape_and_fit(img, scr_w, scr_h, rotation=-rotation)
-            surf = pil_to_surface(canvas)
-            screen.blit(surf, (0, 0))
+        base = _get_screensaver_surface(image_path, scr_w, scr_h, rotation)
+        if base is not None:
+            timed_blit(screen, base, (0, 0), "screensaver")
+        else:
+            screen.fill((0, 0, 0))
 
         _draw_status_bar(screen, scr_w, scr_h, message, rotation)
         display_url(screen, scr_w, scr_h, rotation)
         pygame.display.flip()
     except Exception as e:
         print(f"[display] Error showing screensaver: {e}")
+        screen.fill((0, 0, 0))
         pygame.display.flip()
 
-def display_image(screen, image_path, scr_w, scr_h, rotation=0):
-    """Displays an image on the screen with a black background."""
-    try:
-        img = Image.open(image_path).convert("RGBA")
+def render_frame(image_path, scr_w, scr_h, rotation=0):
+    """
+    Returns the screen-ready Surface for an image, rendering it only on a
+    render cache miss.
+    """
+    derived = cache_handler.derivative_for(image_path, scr_w, scr_h, rotation)
+    if derived is None:
+        # A frame made for another screen is letterboxed for it; render from
+        # the poster's upright original or copy instead
+        image_path = cache_handler.upright_source(image_path)
+        if image_path is None:
+            raise FileNotFoundError("only derivatives for another screen are cached")
+
+    key = render_cache.make_key(derived or image_path, scr_w, scr_h, rotation)
+    surf = render_cache.get(key)
+    if surf is not None:
+        return surf
 
-        canvas = make_landscape_and_fit(
-            img, scr_w, scr_h, rotation=-rotation
-        )
+    if derived is not None:
+        # Rotated and fitted at ingest; the file on disk already is the frame
+        surf = to_display_format(pygame.image.load(str(derived)))
+        render_cache.put(key, surf, disk=False)
+        return surf
 
-        # Create black background
-        bg = Image.new("RGBA", canvas.size, (0, 0, 0, 255))
-        bg.paste(canvas, (0, 0), canvas)
+    with open_for_screen(image_path, scr_w, scr_h, rotation) as img:
+        surf = frame_surface(img, scr_w, scr_h, rotation)
+    render_cache.put(key, surf)
+    return surf
 
-        # Convert to pygame surface
-        surf = pil_to_surface(bg)
+def display_image(screen, image_path, scr_w, scr_h, rotation=0):
+    """Displays an image on the screen with a black background."""
+    try:
+        surf = render_frame(image_path, scr_w, scr_h, rotation)
 
-        screen.blit(surf, (0, 0))
+        timed_blit(screen, surf, (0, 0), "poster")
         pygame.display.flip()
 
-        bg.save("output.png")
+        # Shared with config_portal's /snapshot; no encoding on the render path
+        frame_buffer.publish(surf)
 
         return True
 
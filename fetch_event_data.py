@@ -12,6 +12,8 @@ import json
 import requests
 from datetime import datetime
 
+import file_utils
+
 # Configuration
 with open(Path(__file__).parent / 'config.json', 'r') as f:
     config = json.load(f)
@@ -75,8 +77,7 @@ def save_event_data(event_data, file_path=None):
         # Ensure parent directory exists
         file_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(event_data, f, indent=2, ensure_ascii=False)
+        file_utils.atomic_write_json(file_path, event_data, indent=2, ensure_ascii=False)
         
         print(f"[save_event_data] Saved event data to {file_path}")
         return True
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+file_utils.py
+
+Crash-safe file writes shared by every writer of config.json,
+api_data.json and event_data.json. Data goes to a temp file in the same
+directory, is fsynced and then renamed over the target, so a concurrent
+reader sees either the old or the new file, never a half-written one.
+"""
+from pathlib import Path
+import os
+import json
+import tempfile
+
+
+def atomic_write_bytes(path, data):
+    """
+    Atomically replaces path with data.
+    The existing file's permissions (and owner, when running as root) are
+    kept so the portal (root) and the display (user) can both still read it.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        st = None
+
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if st is not None:
+            os.chmod(tmp_name, st.st_mode & 0o7777)
+            if os.geteuid() == 0:
+                os.chown(tmp_name, st.st_uid, st.st_gid)
+        else:
+            os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try: os.remove(tmp_name)
+        except OSError: pass
+        raise
+
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(str(path.parent), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """Atomically writes data as JSON; dump_kwargs go to json.dumps."""
+    text = json.dumps(data, **dump_kwargs)
+    atomic_write_bytes(path, text.encode('utf-8'))
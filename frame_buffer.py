@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+frame_buffer.py
+
+Shares the last displayed poster frame between the display process and
+config_portal through a raw RGB file in /dev/shm (tmpfs), so the render
+loop never encodes images or writes to the SD card.
+
+Layout: header (magic, width, height, seq, done_seq) followed by
+width * height * 3 bytes of RGB. The writer sets seq, copies the pixels,
+then sets done_seq; a reader only trusts a frame whose seq == done_seq
+before and after copying it.
+"""
+from pathlib import Path
+import os
+import mmap
+import struct
+import tempfile
+import time
+
+SHM_DIR = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+FRAME_FILE = SHM_DIR / "eposter_frame"
+_HEADER = struct.Struct("<4sIIQQ")
+_MAGIC = b"EPFB"
+
+_writer = {"fd": None, "map": None, "size": 0, "last": None}
+
+
+def _open_map(size):
+    if _writer["map"] is not None and _writer["size"] == size:
+        return _writer["map"]
+    if _writer["map"] is not None:
+        _writer["map"].close()
+        os.close(_writer["fd"])
+    fd = os.open(str(FRAME_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    os.fchmod(fd, 0o644)
+    os.ftruncate(fd, size)
+    _writer.update(fd=fd, map=mmap.mmap(fd, size), size=size)
+    return _writer["map"]
+
+
+def publish(surface):
+    """
+    Publishes a pygame Surface as the current frame. Publishing the same
+    Surface object twice in a row is a no-op.
+    """
+    import pygame
+
+    if surface is _writer["last"]:
+        return
+    try:
+        w, h = surface.get_size()
+        mm = _open_map(_HEADER.size + w * h * 3)
+        seq = time.time_ns()
+        _HEADER.pack_into(mm, 0, _MAGIC, w, h, seq, 0)
+        mm[_HEADER.size:] = pygame.image.tostring(surface, "RGB")
+        _HEADER.pack_into(mm, 0, _MAGIC, w, h, seq, seq)
+        _writer["last"] = surface
+    except Exception as e:
+        print(f"[frame_buffer] Failed to publish frame: {e}")
+
+
+def read_header():
+    """Returns (width, height, seq) of the committed frame, or None."""
+    try:
+        with open(FRAME_FILE, 'rb') as f:
+            header = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(header) != _HEADER.size:
+        return None
+    magic, w, h, seq, done = _HEADER.unpack(header)
+    if magic != _MAGIC or seq != done or seq == 0:
+        return None
+    return w, h, seq
+
+
+def read_frame(retries=3):
+    """Returns (width, height, seq, rgb_bytes) for a consistent frame, or None."""
+    for _ in range(retries):
+        try:
+            with open(FRAME_FILE, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+        magic, w, h, seq, done = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or seq == 0 or len(data) != _HEADER.size + w * h * 3:
+            return None
+        # A frame rewritten while we copied it shows up as a new header
+        if seq == done and read_header() == (w, h, seq):
+            return w, h, seq, data[_HEADER.size:]
+        time.sleep(0.05)
+    return None
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+network_service.py
+
+Cached view of the device's current IP address and link state.
+A background thread listens for rtnetlink link/address events and only
+re-probes when one arrives (or every FALLBACK_INTERVAL seconds where
+netlink is unavailable), so overlays read the IP without any syscalls.
+"""
+import socket
+import select
+import threading
+import time
+
+LOOPBACK_IP = "127.0.0.1"
+FALLBACK_INTERVAL = 10.0   # seconds between probes without netlink
+RESCAN_INTERVAL = 60.0     # safety re-probe while waiting on netlink
+SETTLE_DELAY = 0.2         # let a burst of netlink events finish
+
+# <linux/rtnetlink.h> multicast groups
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+_lock = threading.Lock()
+_state = {"ip": None, "thread": None, "changed_at": 0.0}
+
+
+def probe_ip():
+    """Finds the local IP used for outbound traffic (no packets are sent)."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("8.8.8.8", 80))
+        return s.getsockname()[0]
+    except Exception:
+        return LOOPBACK_IP
+    finally:
+        s.close()
+
+
+def _refresh():
+    ip = probe_ip()
+    with _lock:
+        if ip != _state["ip"]:
+            if _state["ip"] is not None:
+                print(f"[network] IP changed: {_state['ip']} -> {ip}")
+            _state["ip"] = ip
+            _state["changed_at"] = time.time()
+
+
+def _netlink_socket():
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        return sock
+    except (AttributeError, OSError) as e:
+        print(f"[network] netlink unavailable, polling instead: {e}")
+        return None
+
+
+def _watch():
+    sock = _netlink_socket()
+    if sock is None:
+        while True:
+            time.sleep(FALLBACK_INTERVAL)
+            _refresh()
+
+    while True:
+        ready, _, _ = select.select([sock], [], [], RESCAN_INTERVAL)
+        if ready:
+            time.sleep(SETTLE_DELAY)
+            # Drain the burst; the content does not matter, only that something changed
+            while select.select([sock], [], [], 0)[0]:
+                sock.recv(65536)
+        _refresh()
+
+
+def start():
+    """Probes once and starts the watcher thread."""
+    with _lock:
+        if _state["thread"] is not None:
+            return
+        _state["thread"] = threading.Thread(target=_watch, name="network-watch", daemon=True)
+    _refresh()
+    _state["thread"].start()
+
+
+def get_ip():
+    """Returns the cached local IP ("127.0.0.1" when offline)."""
+    if _state["thread"] is None:
+        start()
+    return _state["ip"] or LOOPBACK_IP
+
+
+def is_connected():
+    """True when the device has a non-loopback IP."""
+    return get_ip() != LOOPBACK_IP
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+poster_store.py
+
+In-memory view of api_data.json for the display process. The file is
+parsed once per data refresh into per-screen record lists and schedules,
+plus hash indexes by id, PosterId and paper_id, so the modes and the
+overlay never re-read the file or scan record lists for a lookup.
+"""
+from pathlib import Path
+from datetime import datetime
+import json
+import threading
+
+import schedule_index
+
+SCRIPT_DIR = Path(__file__).parent
+API_DATA_JSON = SCRIPT_DIR / "api_data.json"
+DEFAULT_MINUTES_PER_RECORD = 5
+
+_lock = threading.Lock()
+# Replaced as a whole on refresh, so readers always see one consistent parse
+_store = {"version": None, "screens": {}, "by_id": {}, "by_poster_id": {}, "by_paper_id": {}}
+
+
+def parse_datetime(date_str, fmt="%d-%m-%Y %H:%M:%S"):
+    try: return datetime.strptime(date_str, fmt)
+    except: return None
+
+
+def _add_timed_record(records, r):
+    s = parse_datetime(r.get("start_date_time"))
+    e = parse_datetime(r.get("end_date_time"))
+    if s and e:
+        r["start_dt"] = s
+        r["end_dt"] = e
+        records.append(r)
+
+
+def parse_screen_records(data):
+    """
+    Groups the records of every screen in one pass.
+    Returns {screen_number (str): {"records", "minutes_per_record", "schedule"}}.
+    """
+    screens = {}
+
+    # Try screens first (currently empty in API, but keep for future)
+    for sc in data.get("screens", []):
+        key = str(sc.get("screen_number"))
+        if key in screens:
+            continue
+        entry = screens[key] = {"records": [], "minutes_per_record": sc.get("minutes_per_record", DEFAULT_MINUTES_PER_RECORD)}
+        for r in sc.get("records", []):
+            _add_timed_record(entry["records"], r)
+
+    # Always also check booking_slot for each screen
+    for b in data.get("booking_slot", []):
+        # booking_slot entries have records as a list directly
+        slot_records = b.get("records", [])
+        if not isinstance(slot_records, list):
+            continue
+        key = str(b.get("screen_number"))
+        entry = screens.setdefault(key, {"records": [], "minutes_per_record": DEFAULT_MINUTES_PER_RECORD})
+        for r in slot_records:
+            _add_timed_record(entry["records"], r)
+
+    for entry in screens.values():
+        entry["schedule"] = schedule_index.build_schedule(entry["records"])
+    return screens
+
+
+def build(data, version=None):
+    """Builds a store from parsed api_data.json content."""
+    screens = parse_screen_records(data)
+    by_id, by_poster_id, by_paper_id = {}, {}, {}
+    for entry in screens.values():
+        for r in entry["records"]:
+            # First occurrence wins; a poster booked on several screens is the same poster
+            if r.get("id") is not None: by_id.setdefault(str(r["id"]), r)
+            if r.get("PosterId") is not None: by_poster_id.setdefault(str(r["PosterId"]), r)
+            if r.get("paper_id") is not None: by_paper_id.setdefault(str(r["paper_id"]), r)
+    return {"version": version, "screens": screens,
+            "by_id": by_id, "by_poster_id": by_poster_id, "by_paper_id": by_paper_id}
+
+
+def data_version():
+    try:
+        st = API_DATA_JSON.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def refresh():
+    """
+    Rebuilds the store if api_data.json changed since the last build.
+    A file that fails to parse keeps the last good store. Returns True
+    when the store was rebuilt.
+    """
+    global _store
+    version = data_version()
+    if version is None or version == _store["version"]:
+        return False
+    with _lock:
+        if version == _store["version"]:
+            return False
+        try:
+            with open(API_DATA_JSON, 'r') as f:
+                data = json.load(f)
+            _store = build(data, version)
+        except Exception as e:
+            print(f"[poster_store] Error parsing {API_DATA_JSON.name}, keeping last good data: {e}")
+            return False
+    return True
+
+
+def _current():
+    if _store["version"] is None:
+        refresh()
+    return _store
+
+
+def screen(device_id):
+    """Returns {"records", "minutes_per_record", "schedule"} for a screen, or None."""
+    return _current()["screens"].get(str(device_id))
+
+
+def records(device_id):
+    """Returns (records, minutes_per_record) for a screen."""
+    entry = screen(device_id)
+    if not entry:
+        return [], DEFAULT_MINUTES_PER_RECORD
+    return entry["records"], entry["minutes_per_record"]
+
+
+def schedule(device_id):
+    """Returns the compiled schedule_index schedule for a screen."""
+    entry = screen(device_id)
+    if not entry:
+        return schedule_index.build_schedule([])
+    return entry["schedule"]
+
+
+def by_id(value):
+    return _current()["by_id"].get(str(value))
+
+
+def by_poster_id(value):
+    return _current()["by_poster_id"].get(str(value))
+
+
+def by_paper_id(value):
+    return _current()["by_paper_id"].get(str(value))
+
+
+def paper_id(poster_id):
+    """
+    Returns the paper_id shown in the overlay for a cached poster id
+    (a record's id or PosterId). Ids without a record show themselves.
+    """
+    record = by_id(poster_id) or by_poster_id(poster_id)
+    return record.get("paper_id") if record else poster_id
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+prefetch_handler.py
+
+Background worker for TIME mode. Runs the periodic data and cache sync, and
+looks ahead over the schedule to download and pre-render the active and
+next N posters before their slot starts, so the render loop never blocks
+on I/O at a slot boundary.
+"""
+from pathlib import Path
+from datetime import datetime
+import json
+import threading
+
+import cache_handler
+import display_handler
+
+# Configuration
+try:
+    with open(Path(__file__).parent / 'config.json', 'r') as f:
+        config = json.load(f)
+except Exception as e:
+    print(f"[prefetch] Could not load config.json: {e}")
+    config = {}
+
+PREFETCH_COUNT = int(config.get("display", {}).get("prefetch_count", 3))
+PREFETCH_INTERVAL = 30  # seconds between look-ahead passes when not woken
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_state = {"records": [], "geometry": None, "thread": None, "sync": None}
+
+
+def upcoming_records(records, now, count=PREFETCH_COUNT):
+    """Returns the records active at `now` plus the next `count` to start."""
+    active, future = [], []
+    for r in sorted(records, key=lambda item: item["start_dt"]):
+        if r["end_dt"] < now:
+            continue
+        if r["start_dt"] <= now:
+            active.append(r)
+        elif len(future) < count:
+            future.append(r)
+    return active[:1] + future
+
+
+def _prepare(record, geometry):
+    pid = record.get("id") or record.get("PosterId")
+    if not pid:
+        return
+    path = cache_handler.get_image_path(pid)
+    if not path:
+        cache_handler.download_records([record])
+        path = cache_handler.get_image_path(pid)
+    if path:
+        display_handler.render_frame(path, *geometry)
+
+
+def _worker():
+    while True:
+        _wakeup.wait(timeout=PREFETCH_INTERVAL)
+        _wakeup.clear()
+        with _lock:
+            sync, _state["sync"] = _state["sync"], None
+        if sync is not None:
+            try:
+                sync()
+            except Exception as e:
+                print(f"[prefetch] Sync failed: {e}")
+        with _lock:
+            records, geometry = _state["records"], _state["geometry"]
+        if not records or geometry is None:
+            continue
+        for record in upcoming_records(records, datetime.now()):
+            try:
+                _prepare(record, geometry)
+            except Exception as e:
+                print(f"[prefetch] Failed to prepare {record.get('id')}: {e}")
+
+
+def _start():
+    # Called with _lock held
+    if _state["thread"] is None or not _state["thread"].is_alive():
+        _state["thread"] = threading.Thread(target=_worker, name="prefetch", daemon=True)
+        _state["thread"].start()
+
+
+def update(records, scr_w, scr_h, rotation=0):
+    """Hands the current schedule to the worker and triggers a look-ahead pass."""
+    with _lock:
+        _state["records"] = list(records or [])
+        _state["geometry"] = (scr_w, scr_h, rotation)
+        _start()
+    _wakeup.set()
+
+
+def request_sync(job):
+    """
+    Runs job() on the worker before its next look-ahead pass. A job still
+    waiting is replaced, so slow syncs never pile up.
+    """
+    with _lock:
+        _state["sync"] = job
+        _start()
+    _wakeup.set()
+
+
+def clear():
+    """Stops prefetching until the next update()."""
+    with _lock:
+        _state["records"] = []
+        _state["sync"] = None
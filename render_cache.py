@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+render_cache.py
+
+Keeps screen-ready poster frames so switching posters is a single blit.
+Frames are keyed by (poster file stem, file mtime, screen size, rotation),
+where the stem is the poster's content hash for blob-stored posters, and held
+in an in-memory LRU with a byte budget, optionally backed by raw RGB files
+in render_cache/ next to eposter_cache.
+"""
+from pathlib import Path
+from collections import OrderedDict
+import os
+import json
+import threading
+import pygame
+
+# Configuration
+try:
+    with open(Path(__file__).parent / 'config.json', 'r') as f:
+        config = json.load(f)
+except Exception as e:
+    print(f"[render_cache] Could not load config.json: {e}")
+    config = {}
+
+SCRIPT_DIR = Path(__file__).parent
+RENDER_CACHE_DIR = SCRIPT_DIR / "render_cache"
+MEMORY_BUDGET = int(config.get("display", {}).get("render_cache_mb", 64)) * 1024 * 1024
+DISK_CACHE = bool(config.get("display", {}).get("render_cache_disk", True))
+
+_frames = OrderedDict()
+_frames_bytes = 0
+# Frames are filled by the prefetch worker as well as the render loop
+_lock = threading.RLock()
+
+
+def make_key(image_path, scr_w, scr_h, rotation=0):
+    """Builds the cache key for a poster file, or None if it is missing."""
+    try:
+        image_path = Path(image_path)
+        mtime = image_path.stat().st_mtime_ns
+    except OSError:
+        return None
+    return (image_path.stem, mtime, int(scr_w), int(scr_h), int(rotation))
+
+
+def _disk_path(key):
+    poster_id, mtime, w, h, rotation = key
+    return RENDER_CACHE_DIR / f"{poster_id}_{mtime}_{w}x{h}_r{rotation}.rgb"
+
+
+def _surface_bytes(surf):
+    return surf.get_pitch() * surf.get_height()
+
+
+def _remember(key, surf):
+    global _frames_bytes
+    with _lock:
+        old = _frames.pop(key, None)
+        if old is not None:
+            _frames_bytes -= _surface_bytes(old)
+        _frames[key] = surf
+        _frames_bytes += _surface_bytes(surf)
+        # Always keep the newest frame, even if it alone exceeds the budget
+        while _frames_bytes > MEMORY_BUDGET and len(_frames) > 1:
+            _, evicted = _frames.popitem(last=False)
+            _frames_bytes -= _surface_bytes(evicted)
+
+
+def get(key):
+    """Returns the cached frame Surface for key, or None on a miss."""
+    if key is None:
+        return None
+    with _lock:
+        surf = _frames.get(key)
+        if surf is not None:
+            _frames.move_to_end(key)
+            return surf
+
+    if not DISK_CACHE:
+        return None
+    path = _disk_path(key)
+    try:
+        data = path.read_bytes()
+        w, h = key[2], key[3]
+        if len(data) != w * h * 3:
+            print(f"[render_cache] Discarding truncated frame {path.name}")
+            os.remove(path)
+            return None
+        surf = pygame.image.frombuffer(data, (w, h), "RGB")
+        # Stored as packed RGB; converted once so every later blit is a copy
+        if pygame.display.get_surface() is not None:
+            surf = surf.convert()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[render_cache] Failed to load {path.name}: {e}")
+        return None
+    _remember(key, surf)
+    return surf
+
+
+def put(key, surf, disk=True):
+    """
+    Stores a rendered frame in memory and, if enabled, on disk. disk=False
+    is for frames that already load cheaply from their own file.
+    """
+    if key is None:
+        return
+    _remember(key, surf)
+    if not DISK_CACHE or not disk:
+        return
+    path = _disk_path(key)
+    if path.exists():
+        return
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    try:
+        RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Older renders of the same poster at this size/rotation are stale
+        poster_id, _, w, h, rotation = key
+        for old in RENDER_CACHE_DIR.glob(f"{poster_id}_*_{w}x{h}_r{rotation}.rgb"):
+            try: os.remove(old)
+            except FileNotFoundError: pass
+        with open(tmp_path, "wb") as fh:
+            fh.write(pygame.image.tostring(surf, "RGB"))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[render_cache] Failed to write {path.name}: {e}")
+        if tmp_path.exists():
+            try: os.remove(tmp_path)
+            except: pass
+
+
+def invalidate(source=None, rotation=None):
+    """
+    Drops cached frames matching source (a poster file stem) and/or rotation.
+    With no arguments the whole cache is cleared.
+    """
+    global _frames_bytes
+    with _lock:
+        for key in list(_frames):
+            if source is not None and key[0] != str(source):
+                continue
+            if rotation is not None and key[4] != int(rotation):
+                continue
+            _frames_bytes -= _surface_bytes(_frames.pop(key))
+
+    if not RENDER_CACHE_DIR.exists():
+        return
+    id_part = str(source) if source is not None else "*"
+    rot_part = f"r{int(rotation)}" if rotation is not None else "r*"
+    for path in RENDER_CACHE_DIR.glob(f"{id_part}_*_*x*_{rot_part}.rgb"):
+        try:
+            os.remove(path)
+        except Exception as e:
+            print(f"[render_cache] Error deleting {path.name}: {e}")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+schedule_index.py
+
+Compiles a screen's records into a sorted timeline so the active poster,
+the next start and the time until the next change are bisect lookups.
+
+A schedule is a dict:
+    bounds  - sorted list of every start_dt / end_dt
+    active  - active[i] is the record shown during [bounds[i], bounds[i+1])
+    starts  - sorted list of start_dt values
+"""
+from bisect import bisect_right
+import heapq
+
+
+def build_schedule(records):
+    """
+    Builds the schedule for a list of records carrying start_dt / end_dt.
+    Where slots overlap, the record with the earliest start wins (ties keep
+    list order), matching a linear scan over records sorted by start_dt.
+    """
+    ordered = sorted(records, key=lambda r: r["start_dt"])
+    bounds = sorted({r["start_dt"] for r in ordered} | {r["end_dt"] for r in ordered})
+
+    active = []
+    running = []  # heap of (start_dt, order, end_dt)
+    i = 0
+    for t in bounds:
+        while i < len(ordered) and ordered[i]["start_dt"] <= t:
+            heapq.heappush(running, (ordered[i]["start_dt"], i, ordered[i]["end_dt"]))
+            i += 1
+        while running and running[0][2] <= t:
+            heapq.heappop(running)
+        active.append(ordered[running[0][1]] if running else None)
+
+    return {
+        "bounds": bounds,
+        "active": active,
+        "starts": [r["start_dt"] for r in ordered],
+    }
+
+
+def active_record(schedule, now):
+    """Returns the record active at `now`, or None."""
+    i = bisect_right(schedule["bounds"], now) - 1
+    if i < 0:
+        return None
+    return schedule["active"][i]
+
+
+def next_start(schedule, now):
+    """Returns the first start_dt strictly after `now`, or None."""
+    i = bisect_right(schedule["starts"], now)
+    return schedule["starts"][i] if i < len(schedule["starts"]) else None
+
+
+def next_change(schedule, now):
+    """Returns the next time the active record can change, or None."""
+    i = bisect_right(schedule["bounds"], now)
+    return schedule["bounds"][i] if i < len(schedule["bounds"]) else None
+
+
+def seconds_until_change(schedule, now):
+    """Seconds until next_change(), or None if nothing changes any more."""
+    change = next_change(schedule, now)
+    if change is None:
+        return None
+    return max(0.0, (change - now).total_seconds())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+thumbnail_loader.py
+
+Background decoder for MENU mode thumbnails. The menu asks for the posters
+in its visible window (plus read-ahead) and draws placeholders; the worker
+loads each thumbnail off the render thread and posts a THUMBNAIL_READY
+event carrying the decoded Surface. Only the latest request is honoured,
+so scrolling past posters never queues up stale work.
+"""
+import threading
+
+import pygame
+
+import cache_handler
+
+# Posted with poster_id, size and surface (not yet convert()ed: the menu
+# converts the ones it keeps)
+THUMBNAIL_READY = pygame.event.custom_type()
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_state = {"wanted": [], "size": None, "thread": None}
+
+
+def _next_job():
+    with _lock:
+        if not _state["wanted"]:
+            return None
+        return _state["wanted"].pop(0), _state["size"]
+
+
+def _worker():
+    while True:
+        _wakeup.wait()
+        _wakeup.clear()
+        while True:
+            job = _next_job()
+            if job is None:
+                break
+            poster_id, size = job
+            try:
+                thumb = cache_handler.get_thumbnail(poster_id, size)
+                surface = pygame.image.load(str(thumb)) if thumb else None
+            except Exception as e:
+                print(f"[thumbs] Failed to load {poster_id}: {e}")
+                surface = None
+            pygame.event.post(pygame.event.Event(
+                THUMBNAIL_READY, poster_id=poster_id, size=size, surface=surface))
+
+
+def request(poster_ids, size):
+    """
+    Replaces the pending work with poster_ids (in priority order), each
+    loaded as the thumbnail fitting size (w, h).
+    """
+    with _lock:
+        _state["wanted"] = list(poster_ids)
+        _state["size"] = tuple(size)
+        if _state["thread"] is None or not _state["thread"].is_alive():
+            _state["thread"] = threading.Thread(target=_worker, name="thumbnails", daemon=True)
+            _state["thread"].start()
+    _wakeup.set()
+
+
+def clear():
+    """Drops any pending work."""
+    with _lock:
+        _state["wanted"] = []